@@ -1,50 +1,227 @@
 from __future__ import annotations
+import asyncio
 import httpx
-from datetime import datetime, timezone
-from dateutil import parser as dateparser
+from datetime import datetime, timezone, timedelta
 from tenacity import retry, wait_exponential_jitter, stop_after_attempt
 from loguru import logger
 from typing import List
+import math
+from sqlalchemy import select, update
 
-from ..config import settings
-from .base_provider import BaseProvider, ReadingDTO
+try:  # optional fast JSON decoder
+    import orjson
+except ImportError:
+    orjson = None
 
-AIRNOW_ENDPOINT = "https://www.airnowapi.org/aq/observation/latLong/current"
+from ..config import get_settings
+from ..db import SessionLocal
+from ..metrics import count_retry
+from ..models import AirNowArea
+from ..store import _insert_for
+from .base_provider import BaseProvider, DeadlineMissed, ReadingDTO
+from .spatial import plan_clusters, assign_to_members, haversine_miles
+from .response_cache import response_cache, observation_expiry
+
+AIRNOW_PATH = "/aq/observation/latLong/current"
+SEARCH_RADIUS_MILES = 25
+PM25_NAMES = frozenset(("pm2.5", "pm25"))
+
+# AirNow's LocalTimeZone is an abbreviation that already encodes standard vs
+# daylight time, so each maps to a fixed UTC offset (a ZoneInfo would re-derive DST).
+_TZ_OFFSETS = {
+    "UTC": 0, "GMT": 0,
+    "EST": -5, "EDT": -4, "CST": -6, "CDT": -5, "MST": -7, "MDT": -6,
+    "PST": -8, "PDT": -7, "AKST": -9, "AKDT": -8, "HST": -10,
+    "AST": -4, "ADT": -3, "SST": -11, "CHST": 10,
+}
+TZ_TABLE = {abbr: timezone(timedelta(hours=h)) for abbr, h in _TZ_OFFSETS.items()}
+
+def _decode(r: httpx.Response) -> list[dict]:
+    return orjson.loads(r.content) if orjson is not None else r.json()
+
+# A shared query whose answer lacked its members' area isn't retried for this long
+CLUSTER_RETRY = timedelta(days=1)
+
+def _recently_failed(a: AirNowArea, now: datetime) -> bool:
+    if a.cluster_failed_at is None:
+        return False
+    failed_at = a.cluster_failed_at
+    if failed_at.tzinfo is None:
+        failed_at = failed_at.replace(tzinfo=timezone.utc)  # SQLite hands back naive UTC
+    return now - failed_at < CLUSTER_RETRY
+
+def _home_area(lat: float, lon: float, rows: List[ReadingDTO]) -> tuple[float, float] | None:
+    """The reporting area a query at (lat, lon) resolved to: the nearest one in its answer."""
+    areas = {(r.station_lat, r.station_lon) for r in rows if r.station_lat is not None and r.station_lon is not None}
+    return min(areas, key=lambda a: haversine_miles(lat, lon, *a)) if areas else None
+
+def _load_areas(locations: list) -> dict[int, AirNowArea]:
+    """Learned areas for `locations`, ignoring any learned before a location moved."""
+    points = {loc.id: (loc.lat, loc.lon) for loc in locations}
+    with SessionLocal() as db:
+        rows = db.execute(select(AirNowArea).where(AirNowArea.location_id.in_(points))).scalars()
+        return {a.location_id: a for a in rows if (a.lat, a.lon) == points[a.location_id]}
+
+def _save_areas(learned: list[dict], failed: list[int], now: datetime) -> None:
+    with SessionLocal() as db:
+        if learned:
+            ins = _insert_for(db)(AirNowArea)
+            db.execute(ins.on_conflict_do_update(
+                index_elements=[AirNowArea.location_id],
+                set_=dict(lat=ins.excluded.lat, lon=ins.excluded.lon, area_lat=ins.excluded.area_lat,
+                          area_lon=ins.excluded.area_lon, learned_at=ins.excluded.learned_at,
+                          cluster_failed_at=None),
+            ), learned)
+        if failed:
+            db.execute(update(AirNowArea).where(AirNowArea.location_id.in_(failed)).values(cluster_failed_at=now))
+        db.commit()
 
 class AirNowProvider(BaseProvider):
     name = "airnow"
+    async_mode = True
 
-    @retry(wait=wait_exponential_jitter(1, 8), stop=stop_after_attempt(4))
-    def fetch_by_location(self, lat: float, lon: float) -> List[ReadingDTO]:
-        params = {
+    @property
+    def endpoint(self) -> str:
+        return get_settings().airnow_base_url.rstrip("/") + AIRNOW_PATH
+
+    def _params(self, lat: float, lon: float, distance: float = SEARCH_RADIUS_MILES) -> dict:
+        return {
             "format": "application/json",
             "latitude": str(lat),
             "longitude": str(lon),
-            "distance": "25",  # miles radius
-            "API_KEY": settings.airnow_api_key or "",
+            "distance": str(math.ceil(distance)),  # miles radius
+            "API_KEY": get_settings().airnow_api_key or "",
         }
-        r = httpx.get(AIRNOW_ENDPOINT, params=params, timeout=20)
-        r.raise_for_status()
-        data = r.json()
-        # AirNow returns multiple pollutants; filter for PM2.5
-        pm25_rows = [d for d in data if str(d.get("ParameterName", "")).lower() in ("pm2.5", "pm25")]
+
+    def _parse(self, data: list[dict]) -> List[ReadingDTO]:
         out: List[ReadingDTO] = []
-        for row in pm25_rows:
+        construct = ReadingDTO.model_construct  # fields are built here from known types; skip validation
+        utc = timezone.utc
+        for row in data:
+            # AirNow returns multiple pollutants; filter for PM2.5
+            if str(row.get("ParameterName", "")).lower() not in PM25_NAMES:
+                continue
             val = row.get("AQI")
             # AirNow sometimes includes Concentration; AQI is not µg/m3. Prefer Concentration if present.
             conc = row.get("Concentration")
-            observed = row.get("DateObserved")
-            hour = row.get("HourObserved")
-            tz = row.get("LocalTimeZone", "UTC")
-            # Compose timestamp; treat as local then convert to UTC best-effort
-            ts_local = dateparser.parse(f"{observed} {hour:02d}:00:00 {tz}")
-            ts_utc = ts_local.astimezone(timezone.utc)
+            observed = row.get("DateObserved", "").strip()  # "YYYY-MM-DD " (trailing space)
+            tz_abbr = str(row.get("LocalTimeZone") or "UTC").upper()
+            tz = TZ_TABLE.get(tz_abbr)
+            if tz is None:
+                logger.warning(f"AirNow: unknown LocalTimeZone {tz_abbr!r}; treating as UTC")
+                tz = utc
+            ts_utc = datetime(int(observed[0:4]), int(observed[5:7]), int(observed[8:10]),
+                              int(row.get("HourObserved") or 0), tzinfo=tz).astimezone(utc)
             pm25_ugm3 = float(conc) if conc is not None else float(val or 0)  # fallback; not ideal but workable
-            out.append(ReadingDTO(
+            out.append(construct(
                 observed_at=ts_utc,
                 pm25_ugm3=pm25_ugm3,
                 aqi=int(val) if val is not None else None,
-                provider=self.name
+                provider=self.name,
+                station_lat=row.get("Latitude"),
+                station_lon=row.get("Longitude"),
             ))
+        return out
+
+    @retry(wait=wait_exponential_jitter(1, 8), stop=stop_after_attempt(4), before_sleep=count_retry("airnow"))
+    def _get(self, params: dict) -> list[dict]:
+        r = httpx.get(self.endpoint, params=params, timeout=get_settings().http_timeout_seconds)
+        r.raise_for_status()
+        return _decode(r)
+
+    @retry(wait=wait_exponential_jitter(1, 8), stop=stop_after_attempt(4), before_sleep=count_retry("airnow"))
+    async def _aget(self, client: httpx.AsyncClient, params: dict) -> list[dict]:
+        # Same retry/backoff as the sync path, but the connection comes from the caller's shared pool
+        r = await client.get(self.endpoint, params=params)
+        r.raise_for_status()
+        return _decode(r)
+
+    def fetch_by_location(self, lat: float, lon: float) -> List[ReadingDTO]:
+        params = self._params(lat, lon)
+        key = response_cache.key(self.endpoint, params)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+        out = self._parse(self._get(params))
+        response_cache.put(key, out, observation_expiry())
         logger.info(f"AirNow: {len(out)} PM2.5 rows for lat={lat} lon={lon}")
         return out
+
+    async def afetch_by_location(self, client: httpx.AsyncClient, lat: float, lon: float,
+                                 distance: float = SEARCH_RADIUS_MILES) -> List[ReadingDTO]:
+        params = self._params(lat, lon, distance)
+        key = response_cache.key(self.endpoint, params)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+        out = self._parse(await self._aget(client, params))
+        response_cache.put(key, out, observation_expiry())
+        logger.info(f"AirNow: {len(out)} PM2.5 rows for lat={lat} lon={lon}")
+        return out
+
+    async def afetch_for_locations(self, client: httpx.AsyncClient, locations: list, sem: asyncio.Semaphore,
+                                   deadline: float | None = None) -> dict[int, list[ReadingDTO]]:
+        """
+        latLong/current answers with the single reporting area nearest the
+        query point, so nearby locations can only share a query when they
+        resolve to the same area. Each location's own query records its area
+        (airnow_areas); within a grid cluster, locations whose recorded areas
+        match are served by one query at that area's coordinates, which
+        resolves to the area itself. Locations with no recorded area, a lone
+        area, or a shared query that recently came back without their area
+        make their own query, which records or refreshes the area.
+        """
+        now = datetime.now(timezone.utc)
+        cell_miles = get_settings().cluster_cell_miles
+        areas = await asyncio.to_thread(_load_areas, locations) if cell_miles > 0 else {}
+        groups: list[tuple[tuple[float, float], list]] = []
+        solo: list = []
+        for c in plan_clusters(locations, cell_miles):
+            by_area: dict[tuple[float, float], list] = {}
+            for m in c.members:
+                a = areas.get(m.id)
+                if a is None or _recently_failed(a, now):
+                    solo.append(m)
+                else:
+                    by_area.setdefault((a.area_lat, a.area_lon), []).append(m)
+            for area, members in by_area.items():
+                if len(members) > 1:
+                    groups.append((area, members))
+                else:
+                    solo.extend(members)
+
+        async def one(area) -> List[ReadingDTO]:
+            async with sem:
+                return await self._timed(self.afetch_by_location(client, *area))
+
+        results = await self._gather_until([one(area) for area, _ in groups], deadline)
+        out: dict[int, list[ReadingDTO]] = {}
+        failed: list[int] = []
+        for (area, members), res in zip(groups, results):
+            if isinstance(res, DeadlineMissed):
+                continue
+            if isinstance(res, BaseException):
+                logger.warning(f"AirNow: shared fetch failed for {[m.name for m in members]}: {res!r}")
+                solo.extend(members)
+                continue
+            assigned = assign_to_members(members, res, SEARCH_RADIUS_MILES, {m.id: area for m in members})
+            if len(assigned) < len(members):
+                logger.info(f"AirNow: area {area} missing from its own answer; {[m.name for m in members]} query alone")
+                failed.extend(m.id for m in members)
+                solo.extend(members)
+                continue
+            out.update(assigned)
+
+        own = await super().afetch_for_locations(client, solo, sem, deadline)
+        out.update(own)
+        learned = []
+        for m in solo:
+            home = _home_area(m.lat, m.lon, own.get(m.id) or [])
+            a = areas.get(m.id)
+            if home is not None and (a is None or (a.area_lat, a.area_lon) != home):
+                learned.append(dict(location_id=m.id, lat=m.lat, lon=m.lon, area_lat=home[0], area_lon=home[1],
+                                    learned_at=now, cluster_failed_at=None))
+        if cell_miles > 0 and (learned or failed):
+            await asyncio.to_thread(_save_areas, learned, failed, now)
+        logger.info(f"AirNow: {len(groups) + len(solo)} upstream requests for {len(locations)} locations")
+        return out
@@ -0,0 +1,317 @@
+from __future__ import annotations
+import asyncio
+import json
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from itertools import islice
+from urllib.parse import parse_qs, urlencode, urlsplit
+from loguru import logger
+from sqlalchemy import func, select
+
+from .config import get_settings
+from .db import ReadSession
+from .models import Location, Reading
+from .cache import latest_cache
+from .rolling import rolling
+from .archive import iter_readings
+from .logic.reporter import latest_readings_by_location, daily_stats_stmt
+from .metrics import api_requests, api_request_seconds
+
+MAX_HISTORY_DAYS = 31
+MAX_HISTORY_ROWS = 10_000
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 500: "Internal Server Error"}
+
+try:
+    import orjson
+
+    def _dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # orjson is optional; stdlib output is equivalent, just slower
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+def _iso(dt: datetime | None) -> str | None:
+    if dt is None:
+        return None
+    return (dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)).isoformat()
+
+def _param_ts(q: dict, name: str) -> datetime | None:
+    if name not in q:
+        return None
+    try:
+        dt = datetime.fromisoformat(q[name])
+    except ValueError:
+        raise HttpError(400, f"{name} must be an ISO-8601 date or timestamp")
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+def _hour_floor(now: datetime) -> datetime:
+    return now.replace(minute=0, second=0, microsecond=0)
+
+# Handlers run on a worker thread with a read-only session. Anything time-relative
+# is anchored to the current UTC hour, which is part of the ETag (see ApiServer._etag).
+
+def _locations(db, q: dict) -> dict:
+    rows = db.execute(select(Location.id, Location.name, Location.lat, Location.lon)
+                      .where(Location.active.is_(True)).order_by(Location.id))
+    return {"data": [{"id": i, "name": n, "lat": lat, "lon": lon} for i, n, lat, lon in rows]}
+
+def _latest(db, q: dict) -> dict:
+    ids = None
+    if q.get("location_id"):
+        try:
+            ids = [int(x) for x in q["location_id"].split(",")]
+        except ValueError:
+            raise HttpError(400, "location_id must be a comma-separated list of integers")
+    names = dict(db.execute(select(Location.id, Location.name).where(Location.active.is_(True))).all())
+    latest = latest_readings_by_location(db, ids)
+    rolled = rolling.values(db, list(latest))
+    data = []
+    for lid in sorted(latest):
+        if lid not in names:
+            continue
+        r, rv = latest[lid], rolled.get(lid)
+        data.append({
+            "location_id": lid, "location": names[lid], "provider": r.provider,
+            "observed_at": _iso(r.observed_at), "pm25_ugm3": r.pm25_ugm3, "aqi": r.aqi,
+            "pm25_nowcast": rv.nowcast if rv else None, "pm25_24h": rv.avg24 if rv else None,
+        })
+    return {"data": data}
+
+def _history(db, q: dict, location_id: int) -> dict:
+    """Readings for one location across the hot table and the retention archive."""
+    end = _param_ts(q, "end") or _hour_floor(datetime.now(timezone.utc)) + timedelta(hours=1)
+    start = _param_ts(q, "start") or end - timedelta(hours=24)
+    if not start < end or end - start > timedelta(days=MAX_HISTORY_DAYS):
+        raise HttpError(400, f"start must be before end and the range at most {MAX_HISTORY_DAYS} days")
+    if db.get(Location, location_id) is None:
+        raise HttpError(404, f"no location {location_id}")
+    rows = list(islice(iter_readings(db, start, end, [location_id]), MAX_HISTORY_ROWS + 1))
+    return {
+        "location_id": location_id, "start": _iso(start), "end": _iso(end),
+        "truncated": len(rows) > MAX_HISTORY_ROWS,
+        "data": [{"provider": r.provider, "observed_at": _iso(r.observed_at), "pm25_ugm3": r.pm25_ugm3, "aqi": r.aqi}
+                 for r in sorted(rows[:MAX_HISTORY_ROWS], key=lambda r: r.observed_at)],
+    }
+
+def _daily(db, q: dict) -> dict:
+    """Per-location stats for one UTC day (default yesterday) from daily_rollups."""
+    try:
+        day = date.fromisoformat(q["date"]) if "date" in q else datetime.now(timezone.utc).date() - timedelta(days=1)
+    except ValueError:
+        raise HttpError(400, "date must be YYYY-MM-DD")
+    rows = db.execute(daily_stats_stmt(day))
+    return {"date": day.isoformat(), "data": [
+        {"location_id": lid, "location": name,
+         "max_pm25": float(mx) if mx is not None else None, "avg_pm25": float(avg) if avg is not None else None}
+        for lid, name, mx, avg in rows
+    ]}
+
+ROUTES = [
+    ("latest", re.compile(r"^/v1/latest$"), _latest),
+    ("locations", re.compile(r"^/v1/locations$"), _locations),
+    ("history", re.compile(r"^/v1/locations/(\d+)/history$"), _history),
+    ("daily", re.compile(r"^/v1/daily$"), _daily),
+]
+
+class ApiServer:
+    """
+    Minimal asyncio HTTP/1.1 (keep-alive, GET/HEAD) JSON API. Queries run on
+    worker threads with read-only sessions. Bodies are cached per URL and
+    tagged with the data version, max(readings.id) plus a checksum of the
+    (small) locations table, which is polled every API_VERSION_POLL_SECONDS.
+    A new version means ingest committed or locations changed, so the
+    response cache and the latest/rolling caches are dropped. Because an ETag
+    depends only on (version, hour, URL), an If-None-Match poll is answered
+    with 304 without touching the database.
+    """
+    def __init__(self, session_factory=None, cache_size: int | None = None, poll_seconds: float | None = None):
+        settings = get_settings()
+        self._session = session_factory or ReadSession
+        self.cache_size = settings.api_cache_size if cache_size is None else cache_size
+        self.poll_seconds = settings.api_version_poll_seconds if poll_seconds is None else poll_seconds
+        self._cache: OrderedDict[str, tuple[str, bytes]] = OrderedDict()
+        self._version: str | None = None
+        self._checked_at = 0.0
+        self._version_lock: asyncio.Lock | None = None
+
+    def _read_version(self) -> str:
+        with self._session() as db:
+            readings = db.execute(select(func.max(Reading.id))).scalar() or 0
+            locations = db.execute(select(Location.id, Location.name, Location.lat, Location.lon, Location.active)
+                                   .order_by(Location.id)).all()
+        return f"{readings:x}.{zlib.crc32(repr(locations).encode()):08x}"
+
+    async def data_version(self) -> str:
+        if self._version is not None and time.monotonic() - self._checked_at < self.poll_seconds:
+            return self._version
+        async with self._version_lock:
+            if self._version is None or time.monotonic() - self._checked_at >= self.poll_seconds:
+                v = await asyncio.to_thread(self._read_version)
+                if v != self._version:
+                    if self._version is not None:
+                        logger.debug(f"API data version {self._version} -> {v}; caches dropped")
+                    self._cache.clear()
+                    latest_cache.invalidate()
+                    rolling.invalidate()
+                    self._version = v
+                self._checked_at = time.monotonic()
+        return self._version
+
+    @staticmethod
+    def _etag(version: str, key: str) -> str:
+        hour = int(time.time() // 3600)
+        return f'"{version}-{hour:x}-{zlib.crc32(key.encode()):08x}"'
+
+    def _run(self, handler, q: dict, args: tuple) -> bytes:
+        with self._session() as db:
+            return _dumps(handler(db, q, *args))
+
+    async def dispatch(self, method: str, target: str, headers: dict) -> tuple[int, str, dict, bytes]:
+        """(status, route, extra headers, body) for one request."""
+        if method not in ("GET", "HEAD"):
+            return 405, "-", {}, _dumps({"error": "method not allowed"})
+        url = urlsplit(target)
+        if url.path == "/healthz":
+            return 200, "healthz", {}, _dumps({"ok": True, "version": await self.data_version()})
+        for name, pattern, handler in ROUTES:
+            m = pattern.match(url.path)
+            if m:
+                break
+        else:
+            return 404, "-", {}, _dumps({"error": "not found"})
+        q = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        key = url.path + "?" + urlencode(sorted(q.items()))
+        etag = self._etag(await self.data_version(), key)
+        hdrs = {"ETag": etag, "Cache-Control": "no-cache"}
+        inm = headers.get("if-none-match")
+        if inm and (inm.strip() == "*" or etag in (t.strip() for t in inm.split(","))):
+            return 304, name, hdrs, b""
+        hit = self._cache.get(key)
+        if hit is not None and hit[0] == etag:
+            self._cache.move_to_end(key)
+            return 200, name, hdrs, hit[1]
+        try:
+            body = await asyncio.to_thread(self._run, handler, q, tuple(int(a) for a in m.groups()))
+        except HttpError as e:
+            return e.status, name, {}, _dumps({"error": str(e)})
+        if self.cache_size > 0:
+            self._cache[key] = (etag, body)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return 200, name, hdrs, body
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    return
+                headers: dict[str, str] = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    # Can't tell where the body ends, so answer and drop the connection
+                    api_requests.inc(route="-", status="400")
+                    await self._respond(writer, method, 400, {}, _dumps({"error": "invalid Content-Length"}), False)
+                    return
+                if length:
+                    await reader.readexactly(length)  # ignored; GET/HEAD only
+
+                t0 = time.perf_counter()
+                try:
+                    status, route, extra, body = await self.dispatch(method, target, headers)
+                except Exception as e:
+                    logger.exception(f"API {method} {target} failed: {e!r}")
+                    status, route, extra, body = 500, "-", {}, _dumps({"error": "internal error"})
+                api_request_seconds.observe(time.perf_counter() - t0, route=route)
+                api_requests.inc(route=route, status=str(status))
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, method, status, extra, body, keep_alive)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, method: str, status: int, extra: dict,
+                       body: bytes, keep_alive: bool) -> None:
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        if status != 304:
+            head += ["Content-Type: application/json", f"Content-Length: {len(body)}"]
+        head += [f"{k}: {v}" for k, v in extra.items()]
+        if not keep_alive:
+            head.append("Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+        if method != "HEAD" and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+    async def start(self, host: str, port: int) -> asyncio.AbstractServer:
+        self._version_lock = asyncio.Lock()
+        server = await asyncio.start_server(self._handle, host, port)
+        logger.info(f"AQI API on http://{host}:{server.sockets[0].getsockname()[1]}/v1/latest")
+        return server
+
+    async def serve_forever(self, host: str, port: int) -> None:
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+class ApiThread:
+    """An ApiServer on its own event loop in a daemon thread (benchmarks, embedding)."""
+    def __init__(self, api: ApiServer, host: str, port: int):
+        self.api = api
+        self._loop = asyncio.new_event_loop()
+        self._server: asyncio.AbstractServer | None = None
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(api.start(host, port))
+            ready.set()
+            self._loop.run_forever()
+
+        threading.Thread(target=run, name="api", daemon=True).start()
+        ready.wait()
+        self.host, self.port = self._server.sockets[0].getsockname()[:2]
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def shutdown(self) -> None:
+        def stop():
+            self._server.close()
+            self._loop.stop()
+        self._loop.call_soon_threadsafe(stop)
+
+def start_api(host: str = "127.0.0.1", port: int = 0, session_factory=None,
+              cache_size: int | None = None, poll_seconds: float | None = None) -> ApiThread:
+    """Serve the API from a daemon thread; call .shutdown() to stop."""
+    return ApiThread(ApiServer(session_factory, cache_size, poll_seconds), host, port)
@@ -0,0 +1,260 @@
+from __future__ import annotations
+import heapq
+import itertools
+import os
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+from sqlalchemy import and_, delete, func, select
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from .config import get_settings
+from .models import Location, Reading
+
+# raw_payload is not archived: ingest stores None, and it's most of a row's size when present
+ARCHIVE_COLUMNS = ("location_id", "provider", "observed_at", "pm25_ugm3", "aqi", "ingested_at")
+ROW_GROUP_ROWS = 50_000  # rows buffered per Parquet row group while streaming a month
+
+class ReadingRow(NamedTuple):
+    location_id: int
+    provider: str
+    observed_at: datetime  # UTC
+    pm25_ugm3: float
+    aqi: int | None
+
+def _pa():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Reading archives need pyarrow: pip install pyarrow") from e
+    return pa, pq
+
+def _schema(pa):
+    return pa.schema([
+        ("location_id", pa.int32()), ("provider", pa.string()),
+        ("observed_at", pa.timestamp("us", tz="UTC")), ("pm25_ugm3", pa.float64()),
+        ("aqi", pa.int32()), ("ingested_at", pa.timestamp("us", tz="UTC")),
+    ])
+
+def _utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+def _month_start(d: date | datetime) -> datetime:
+    return datetime(d.year, d.month, 1, tzinfo=timezone.utc)
+
+def _next_month(m: datetime) -> datetime:
+    return datetime(m.year + m.month // 12, m.month % 12 + 1, 1, tzinfo=timezone.utc)
+
+def archive_dir(root: str | None = None) -> Path:
+    return Path(root or get_settings().archive_dir) / "readings"
+
+def month_path(month: datetime, root: str | None = None) -> Path:
+    return archive_dir(root) / f"{month:%Y-%m}.parquet"
+
+def archived_months(root: str | None = None) -> list[datetime]:
+    d = archive_dir(root)
+    if not d.is_dir():
+        return []
+    return sorted(datetime.strptime(p.stem, "%Y-%m").replace(tzinfo=timezone.utc) for p in d.glob("*.parquet"))
+
+def retention_cutoff(days: int, now: datetime | None = None) -> datetime:
+    """
+    First day of the month containing now - `days`. Only whole months are
+    archived, so each month file is written once rather than rewritten daily.
+    """
+    return _month_start((now or datetime.now(timezone.utc)) - timedelta(days=days))
+
+def _table(pa, schema, rows: list):
+    cols = list(zip(*rows))
+    return pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(cols, schema)], schema=schema)
+
+def _sort_key(row: tuple) -> tuple:
+    return row[0], row[2]  # location_id, observed_at: the file's sort order
+
+def _existing_rows(pq, path: Path) -> Iterator[tuple]:
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=ROW_GROUP_ROWS):
+        yield from zip(*(c.to_pylist() for c in batch.columns))
+
+class _Counted:
+    """Iterator wrapper that counts what it yields."""
+    def __init__(self, it: Iterable):
+        self._it = iter(it)
+        self.n = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = next(self._it)
+        self.n += 1
+        return item
+
+def vacuum(db: Session) -> None:
+    """Return freed pages to the OS. Must run outside a transaction."""
+    engine = db.get_bind()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "sqlite":
+            conn.exec_driver_sql("VACUUM")
+        elif engine.dialect.name == "postgresql":
+            conn.exec_driver_sql("VACUUM (ANALYZE) readings")
+
+def _write_month(month: datetime, rows: Iterable[tuple], root: str | None) -> tuple[int, int]:
+    """
+    Stream `rows` (sorted by location_id, observed_at) into the month's file in
+    row groups of ROW_GROUP_ROWS, merge-joined with what's already there so
+    neither side is held in memory. Keys already archived are skipped, so
+    re-running after a crash between writing and deleting doesn't duplicate
+    anything. Returns (rows consumed, rows added).
+    """
+    pa, pq = _pa()
+    schema = _schema(pa)
+    path = month_path(month, root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0, 0  # nothing new for this month; don't read or rewrite the existing file
+    counted = _Counted(itertools.chain([first], rows))
+    sources = [counted]
+    if path.exists():
+        sources.insert(0, _existing_rows(pq, path))  # listed first, so its copy of a key wins
+    tmp = path.with_suffix(".parquet.tmp")
+    writer = None
+    buf: list[tuple] = []
+    written = 0
+    group_key, group_providers = None, set()
+    try:
+        for row in heapq.merge(*sources, key=_sort_key):
+            key = _sort_key(row)
+            if key != group_key:
+                group_key, group_providers = key, set()
+            if row[1] in group_providers:
+                continue  # same (location, provider, hour) already archived
+            group_providers.add(row[1])
+            buf.append(row)
+            if len(buf) >= ROW_GROUP_ROWS:
+                writer = writer or pq.ParquetWriter(tmp, schema, compression="zstd")
+                writer.write_table(_table(pa, schema, buf))
+                written += len(buf)
+                buf.clear()
+        writer = writer or pq.ParquetWriter(tmp, schema, compression="zstd")
+        if buf:
+            writer.write_table(_table(pa, schema, buf))
+            written += len(buf)
+        writer.close()
+        writer = None
+        existing = pq.ParquetFile(path).metadata.num_rows if path.exists() else 0
+        os.replace(tmp, path)  # a reader sees the old file or the new one, never a partial one
+    finally:
+        if writer is not None:
+            writer.close()
+        tmp.unlink(missing_ok=True)
+    return counted.n, written - existing
+
+def _month_rows(db: Session, loc_ids: list[int], month: datetime, end: datetime) -> Iterator[tuple]:
+    """
+    One month's readings in archive order, location by location: each query
+    walks the (location_id, observed_at) index prefix already sorted, and rows are
+    streamed with yield_per rather than collected.
+    """
+    cols = [getattr(Reading, c) for c in ARCHIVE_COLUMNS]
+    for lid in loc_ids:
+        q = (select(*cols)
+             .where(Reading.location_id == lid, Reading.observed_at >= month, Reading.observed_at < end)
+             .order_by(Reading.observed_at)
+             .execution_options(yield_per=ROW_GROUP_ROWS))
+        for r in db.execute(q):
+            yield (r.location_id, r.provider, _utc(r.observed_at), r.pm25_ugm3, r.aqi,
+                   _utc(r.ingested_at) if r.ingested_at else None)
+
+def archive_readings(db: Session, older_than_days: int | None = None, root: str | None = None,
+                     run_vacuum: bool = True, now: datetime | None = None) -> dict:
+    """
+    Move readings from months wholly older than `older_than_days`
+    (RETENTION_DAYS) into zstd Parquet files, one per UTC month, then delete
+    them from `readings` and VACUUM. Each month's file is in place before its
+    rows are deleted and committed. daily_rollups are kept, so daily and
+    range reports are unaffected; raw readings stay readable via
+    iter_readings().
+    """
+    from .cache import latest_cache
+    days = get_settings().retention_days if older_than_days is None else older_than_days
+    if days <= 0:
+        return {"months": 0, "rows": 0}
+    cutoff = retention_cutoff(days, now)
+    # Oldest hot reading per location: min() over the (location_id, observed_at) index prefix is one
+    # seek each. Rollups outlive archived readings, so they'd restart the walk at the first month ever.
+    first_seen = (select(func.min(Reading.observed_at)).where(Reading.location_id == Location.id)
+                  .correlate(Location).scalar_subquery())
+    firsts = {lid: _utc(first) for lid, first in db.execute(select(Location.id, first_seen)) if first is not None}
+    if not firsts or _month_start(min(firsts.values())) >= cutoff:
+        logger.info(f"Retention: nothing older than {cutoff:%Y-%m-%d}")
+        return {"months": 0, "rows": 0}
+    months = rows_moved = 0
+    month = _month_start(min(firsts.values()))
+    while month < cutoff:
+        end = _next_month(month)
+        loc_ids = sorted(lid for lid, first in firsts.items() if first < end)
+        has_rows = db.execute(
+            select(Reading.id).where(Reading.location_id.in_(loc_ids),
+                                     Reading.observed_at >= month, Reading.observed_at < end).limit(1)
+        ).first()
+        if has_rows is None:
+            month = end  # gap month: don't touch its archive file
+            continue
+        moved, added = _write_month(month, _month_rows(db, loc_ids, month, end), root)
+        if moved:
+            # location_id IN (...) lets SQLite walk the (location_id, observed_at) prefix per location instead of scanning
+            db.execute(delete(Reading).where(and_(Reading.location_id.in_(loc_ids),
+                                                  Reading.observed_at >= month, Reading.observed_at < end)))
+            db.commit()
+            months += 1
+            rows_moved += moved
+            logger.info(f"Retention: archived {moved} readings for {month:%Y-%m} ({added} new in archive)")
+        month = end
+    latest_cache.invalidate()
+    if run_vacuum and rows_moved:
+        vacuum(db)
+    return {"months": months, "rows": rows_moved, "cutoff": cutoff.date().isoformat()}
+
+def iter_archived_readings(start: datetime | None = None, end: datetime | None = None,
+                           location_ids: Iterable[int] | None = None,
+                           root: str | None = None) -> Iterator[ReadingRow]:
+    """Archived readings in [start, end), month by month. Needs pyarrow only if archives exist."""
+    months = [m for m in archived_months(root)
+              if (start is None or _next_month(m) > start) and (end is None or m < end)]
+    if not months:
+        return
+    _, pq = _pa()
+    filters = []
+    if start is not None:
+        filters.append(("observed_at", ">=", start))
+    if end is not None:
+        filters.append(("observed_at", "<", end))
+    if location_ids is not None:
+        filters.append(("location_id", "in", list(location_ids)))
+    for m in months:
+        table = pq.read_table(month_path(m, root), columns=list(ReadingRow._fields), filters=filters or None)
+        for batch in table.to_batches():
+            yield from map(ReadingRow._make, zip(*(c.to_pylist() for c in batch.columns)))
+
+def iter_readings(db: Session, start: datetime | None = None, end: datetime | None = None,
+                  location_ids: Iterable[int] | None = None, chunk: int = 5000) -> Iterator[ReadingRow]:
+    """
+    Readings in [start, end) from the archives and then the hot table, so
+    callers needn't know where the retention cutoff falls.
+    """
+    location_ids = list(location_ids) if location_ids is not None else None
+    yield from iter_archived_readings(start, end, location_ids)
+    q = select(Reading.location_id, Reading.provider, Reading.observed_at, Reading.pm25_ugm3, Reading.aqi)
+    if start is not None:
+        q = q.where(Reading.observed_at >= start)
+    if end is not None:
+        q = q.where(Reading.observed_at < end)
+    if location_ids is not None:
+        q = q.where(Reading.location_id.in_(location_ids))
+    q = q.order_by(Reading.location_id, Reading.observed_at).execution_options(yield_per=chunk)
+    for r in db.execute(q):
+        yield ReadingRow(r.location_id, r.provider, _utc(r.observed_at), r.pm25_ugm3, r.aqi)
@@ -1,15 +1,115 @@
 from __future__ import annotations
+import asyncio
+import time
 from pydantic import BaseModel
 from datetime import datetime
+from loguru import logger
+import httpx
+
+from ..metrics import provider_request_seconds, provider_requests
 
 class ReadingDTO(BaseModel):
     observed_at: datetime  # UTC
     pm25_ugm3: float
     aqi: int | None = None
     provider: str
+    station_lat: float | None = None  # reporting station, when the provider says
+    station_lon: float | None = None
+
+class ProviderStats:
+    """Cumulative per-provider request counters for this process."""
+    __slots__ = ("requests", "errors", "rows", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.requests = self.errors = self.rows = 0
+        self.total_seconds = self.max_seconds = 0.0
+
+    def record(self, seconds: float, ok: bool, rows: int = 0) -> None:
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.rows += rows
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self) -> dict:
+        avg = self.total_seconds / self.requests if self.requests else 0.0
+        return {"requests": self.requests, "errors": self.errors, "rows": self.rows,
+                "avg_seconds": round(avg, 4), "max_seconds": round(self.max_seconds, 4)}
+
+provider_stats: dict[str, ProviderStats] = {}
+
+class DeadlineMissed(Exception):
+    """Stands in for the result of a request cancelled at the cycle's fetch deadline."""
 
 class BaseProvider:
     name: str
     async_mode: bool = False
+
+    @property
+    def stats(self) -> ProviderStats:
+        return provider_stats.setdefault(self.name, ProviderStats())
+
     def fetch_by_location(self, lat: float, lon: float) -> list[ReadingDTO]:
         raise NotImplementedError
+
+    async def afetch_by_location(self, client: httpx.AsyncClient, lat: float, lon: float) -> list[ReadingDTO]:
+        """Async variant used when async_mode is set; `client` is a pooled client shared by the whole cycle."""
+        raise NotImplementedError
+
+    async def _timed(self, coro) -> list[ReadingDTO]:
+        t0 = time.perf_counter()
+        try:
+            out = await coro
+        except Exception:
+            elapsed = time.perf_counter() - t0
+            self.stats.record(elapsed, ok=False)
+            provider_request_seconds.observe(elapsed, provider=self.name)
+            provider_requests.inc(provider=self.name, outcome="error")
+            raise
+        elapsed = time.perf_counter() - t0
+        self.stats.record(elapsed, ok=True, rows=len(out))
+        provider_request_seconds.observe(elapsed, provider=self.name)
+        provider_requests.inc(provider=self.name, outcome="ok")
+        return out
+
+    async def _gather_until(self, coros: list, deadline: float | None) -> list:
+        """
+        Like gather(return_exceptions=True), but stops waiting at `deadline`
+        (event-loop time): requests that finished keep their results, the rest
+        are cancelled and come back as DeadlineMissed.
+        """
+        tasks = [asyncio.ensure_future(c) for c in coros]
+        if not tasks:
+            return []
+        timeout = None if deadline is None else max(deadline - asyncio.get_running_loop().time(), 0.0)
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for t in pending:
+            t.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            provider_requests.inc(len(pending), provider=self.name, outcome="deadline_missed")
+            logger.error(f"{self.name}: {len(pending)}/{len(tasks)} requests missed the fetch deadline; cancelled")
+        return [DeadlineMissed() if t in pending else (t.exception() or t.result()) for t in tasks]
+
+    async def afetch_for_locations(self, client: httpx.AsyncClient, locations: list, sem: asyncio.Semaphore,
+                                   deadline: float | None = None) -> dict[int, list[ReadingDTO]]:
+        """
+        Fetch many locations concurrently, at most `sem` requests in flight.
+        A location that still fails after retries, or is unfinished at
+        `deadline` (event-loop time), is logged and left out.
+        Providers that can share upstream calls between locations override this.
+        """
+        async def one(loc) -> list[ReadingDTO]:
+            async with sem:
+                return await self._timed(self.afetch_by_location(client, loc.lat, loc.lon))
+
+        results = await self._gather_until([one(loc) for loc in locations], deadline)
+        out: dict[int, list[ReadingDTO]] = {}
+        for loc, res in zip(locations, results):
+            if isinstance(res, DeadlineMissed):
+                continue
+            if isinstance(res, BaseException):
+                logger.warning(f"{self.name}: fetch failed for {loc.name}: {res!r}")
+                continue
+            out[loc.id] = res
+        return out
@@ -0,0 +1,399 @@
+from __future__ import annotations
+import asyncio
+import json
+import platform
+import os
+import statistics
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import warnings
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from loguru import logger
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from .notify.email_notifier import EmailNotifier
+from .ingest.airnow_provider import AirNowProvider
+from .ingest.base_provider import ReadingDTO
+from .ingest.response_cache import response_cache
+from .config import get_settings
+from .db import create_all, make_engine, SESSION_OPTS
+from .cache import latest_cache
+from .rolling import rolling
+from .models import Reading, Alert, Location
+from .seed import seed_database
+from .standin import start_standin
+from .runner import ingest_once
+from .logic.evaluator import evaluate_and_generate_alerts
+from .logic.reporter import build_morning_digest_rows, render_digest_html, daily_summary, latest_readings_stmt
+from .store import bulk_insert_readings
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+# Modules `import cli` must not pull in; each belongs to a command that imports it on demand
+STARTUP_FORBIDDEN = ("apscheduler", "httpx", "tenacity", "dateutil", "sqlalchemy", "yaml", "dotenv")
+
+def _smtp_sink(port: int):
+    """Local aiosmtpd server that accepts and counts messages (no TLS, no auth)."""
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError as e:
+        raise RuntimeError("SMTP benchmark needs aiosmtpd: pip install aiosmtpd") from e
+
+    class CountingHandler:
+        def __init__(self):
+            self.count = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            self.count += 1
+            return "250 OK"
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    return controller, handler
+
+def smtp_throughput(messages: int = 200, port: int = 8025) -> dict:
+    """
+    Messages/second for: one connection per message (old path) and one
+    session per batch (send_many).
+    """
+    controller, handler = _smtp_sink(port)
+    controller.start()
+    recipients = ["bench@example.com"]
+    payload = [(f"[bench] {i}", "PM2.5 42.0 µg/m³", recipients, "plain") for i in range(messages)]
+    results: dict[str, float] = {}
+    try:
+        notifier = EmailNotifier(host="127.0.0.1", port=port, starttls=False)
+        t0 = time.perf_counter()
+        for subject, body, rcpts, ct in payload:
+            notifier.send(subject, body, rcpts, content_type=ct)
+        results["per_message"] = messages / (time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        notifier.send_many(payload)
+        results["batch_session"] = messages / (time.perf_counter() - t0)
+    finally:
+        controller.stop()
+    logger.info(f"SMTP sink received {handler.count} messages")
+    return {"scenario": "smtp", "messages": messages, "msgs_per_sec": results}
+
+def _legacy_parse(data: list[dict]) -> list[ReadingDTO]:
+    """The original AirNow parse path (dateutil + validated ReadingDTO per row), kept for comparison."""
+    from dateutil import parser as dateparser
+    out = []
+    for row in data:
+        if str(row.get("ParameterName", "")).lower() not in ("pm2.5", "pm25"):
+            continue
+        val = row.get("AQI")
+        conc = row.get("Concentration")
+        ts_local = dateparser.parse(f"{row.get('DateObserved')} {row.get('HourObserved'):02d}:00:00 {row.get('LocalTimeZone', 'UTC')}")
+        out.append(ReadingDTO(
+            observed_at=ts_local.astimezone(timezone.utc),
+            pm25_ugm3=float(conc) if conc is not None else float(val or 0),
+            aqi=int(val) if val is not None else None,
+            provider="airnow",
+        ))
+    return out
+
+def parse_throughput(iterations: int = 2000, fixture: str = "airnow_observations.json") -> dict:
+    """Rows/sec for the legacy and current AirNow parse paths on a recorded payload."""
+    raw = (FIXTURES / fixture).read_bytes()
+    data = json.loads(raw)
+    provider = AirNowProvider()
+    results: dict[str, float] = {}
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # dateutil warns on every unknown tz abbreviation
+        for name, fn in (("legacy", _legacy_parse), ("fast", provider._parse)):
+            rows = 0
+            t0 = time.perf_counter()
+            for _ in range(iterations):
+                rows += len(fn(data))
+            results[name] = rows / (time.perf_counter() - t0)
+    return {"scenario": "parse", "payload_rows": len(data), "iterations": iterations,
+            "rows_per_sec": results, "speedup": results["fast"] / results["legacy"]}
+
+def _time(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return {"min_s": min(samples), "median_s": statistics.median(samples), "max_s": max(samples), "runs": repeat}
+
+def run_suite(db_path: str = "bench.db", locations: int = 100, years: float = 1.0,
+              latency_ms: float = 50.0, error_rate: float = 0.01, repeat: int = 3,
+              out: str | None = "bench_results.json", reseed: bool = True) -> dict:
+    """
+    Seed a throwaway SQLite database, start the provider stand-in and time the
+    ingest, evaluation, digest and daily-summary paths. Results go to `out` as JSON.
+    """
+    if reseed:
+        Path(db_path).unlink(missing_ok=True)
+    engine = create_engine(f"sqlite:///{db_path}", future=True)
+    Session = sessionmaker(bind=engine, autoflush=False, expire_on_commit=False, future=True)
+    create_all(engine=engine)
+    latest_cache.invalidate()
+    rolling.invalidate()
+
+    report: dict = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "params": {"locations": locations, "years": years, "latency_ms": latency_ms,
+                   "error_rate": error_rate, "repeat": repeat},
+        "scenarios": {},
+    }
+    with Session() as db:
+        if reseed:
+            t0 = time.perf_counter()
+            report["seed"] = seed_database(db, locations, years)
+            report["seed"]["seconds"] = time.perf_counter() - t0
+        report["db_rows"] = {"readings": db.query(Reading).count(), "alerts": db.query(Alert).count()}
+
+    srv = start_standin(latency_ms=latency_ms, jitter_ms=latency_ms / 2, error_rate=error_rate)
+    settings = get_settings()
+    saved = (settings.airnow_base_url, settings.provider, response_cache.max_entries)
+    settings.airnow_base_url, settings.provider, response_cache.max_entries = srv.base_url, "airnow", 0
+    threshold = settings.default_threshold_pm25
+    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+    sc = report["scenarios"]
+    try:
+        with Session() as db:
+            sc["ingest_once"] = _time(lambda: ingest_once(db), repeat)
+            sc["ingest_once"]["standin_requests"] = srv.requests
+            sc["ingest_once"]["standin_errors"] = srv.errors
+
+            def cold(fn):
+                def run():
+                    latest_cache.invalidate()
+                    fn()
+                return run
+            evaluate = lambda: evaluate_and_generate_alerts(db)
+            digest = lambda: render_digest_html(build_morning_digest_rows(db, threshold), threshold)
+            sc["evaluate_cold_cache"] = _time(cold(evaluate), repeat)
+            sc["evaluate_warm_cache"] = _time(evaluate, repeat)
+            sc["digest_cold_cache"] = _time(cold(digest), repeat)
+            sc["digest_warm_cache"] = _time(digest, repeat)
+            sc["daily_summary"] = _time(lambda: daily_summary(db, yesterday), repeat)
+    finally:
+        settings.airnow_base_url, settings.provider, response_cache.max_entries = saved
+        srv.shutdown()
+        engine.dispose()
+
+    if out:
+        Path(out).write_text(json.dumps(report, indent=2))
+        logger.info(f"Benchmark results written to {out}")
+    return report
+
+def _importtime(module: str) -> list[tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) for one fresh `python -X importtime -c 'import module'`."""
+    pkg_root = Path(__file__).resolve().parent.parent
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(pkg_root), os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          capture_output=True, text=True, env=env, cwd=pkg_root)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cum_us, name = (x.strip() for x in line[len("import time:"):].split("|"))
+        rows.append((name, int(self_us), int(cum_us)))
+    return rows
+
+def import_time(module: str | None = None, budget_ms: float = 150.0, repeat: int = 5,
+                forbidden: tuple[str, ...] = STARTUP_FORBIDDEN) -> dict:
+    """
+    Median cumulative import time of `module` (default: this package's cli)
+    over `repeat` fresh interpreters, the slowest imports it pulls in, and any
+    `forbidden` top-level packages it loaded. `ok` is False over budget or if
+    anything forbidden was imported.
+    """
+    module = module or (f"{__package__}.cli" if __package__ else "cli")
+    totals, last = [], []
+    for _ in range(repeat):
+        last = _importtime(module)
+        totals.append(next((cum for name, _, cum in last if name == module), sum(s for _, s, _ in last)))
+    loaded = {name.split(".")[0] for name, _, _ in last}
+    bad = sorted(loaded.intersection(forbidden))
+    median_ms = statistics.median(totals) / 1000
+    return {
+        "module": module,
+        "median_ms": round(median_ms, 1),
+        "budget_ms": budget_ms,
+        "forbidden_loaded": bad,
+        "slowest": [{"module": n, "self_ms": round(s / 1000, 1)}
+                    for n, s, _ in sorted(last, key=lambda r: r[1], reverse=True)[:10]],
+        "ok": median_ms <= budget_ms and not bad,
+    }
+
+def _contend(db_path: str, profile: str, seconds: float, readers: int, batch_hours: int) -> dict:
+    """One writer inserting hourly batches while `readers` threads run report queries."""
+    rolling.invalidate()  # process-wide state must not carry over from another database file
+    write_engine = make_engine(f"sqlite:///{db_path}", profile)
+    read_engine = make_engine(f"sqlite:///{db_path}", profile, read_only=True) if profile == "tuned" else write_engine
+    Write = sessionmaker(bind=write_engine, **SESSION_OPTS)
+    Read = sessionmaker(bind=read_engine, **SESSION_OPTS)
+    with Read() as db:
+        loc_ids = [i for (i,) in db.execute(select(Location.id))]
+    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+    stop = threading.Event()
+    stats = {"writer": {"batches": 0, "rows": 0, "errors": 0, "latency": []},
+             "reader": {"queries": 0, "errors": 0, "latency": []}}
+    lock = threading.Lock()
+
+    def writer():
+        hour = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0) + timedelta(days=1)
+        with Write() as db:
+            while not stop.is_set():
+                rows = [dict(location_id=lid, provider="bench", observed_at=hour + timedelta(hours=h),
+                             pm25_ugm3=float((lid * 7 + h) % 80), aqi=None, raw_payload=None, ingested_at=hour)
+                        for h in range(batch_hours) for lid in loc_ids]
+                hour += timedelta(hours=batch_hours)
+                t0 = time.perf_counter()
+                try:
+                    bulk_insert_readings(db, rows)
+                except Exception:  # "database is locked" under the default profile
+                    db.rollback()
+                    stats["writer"]["errors"] += 1
+                    continue
+                stats["writer"]["latency"].append(time.perf_counter() - t0)
+                stats["writer"]["batches"] += 1
+                stats["writer"]["rows"] += len(rows)
+
+    def reader():
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                with Read() as db:
+                    db.execute(latest_readings_stmt()).all()
+                    daily_summary(db, yesterday)
+            except Exception:
+                with lock:
+                    stats["reader"]["errors"] += 1
+                continue
+            with lock:
+                stats["reader"]["latency"].append(time.perf_counter() - t0)
+                stats["reader"]["queries"] += 1
+
+    threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    write_engine.dispose()
+    read_engine.dispose()
+
+    def pct(xs: list[float], q: float) -> float:
+        return round(sorted(xs)[int(q * (len(xs) - 1))] * 1000, 2) if xs else 0.0
+
+    out = {}
+    for role, s in stats.items():
+        lat = s.pop("latency")
+        s.update(p50_ms=pct(lat, 0.5), p95_ms=pct(lat, 0.95), max_ms=pct(lat, 1.0))
+        out[role] = s
+    out["writer"]["rows_per_sec"] = round(out["writer"]["rows"] / seconds, 1)
+    out["reader"]["queries_per_sec"] = round(out["reader"]["queries"] / seconds, 1)
+    return out
+
+def concurrency_throughput(db_path: str = "bench_concurrency.db", locations: int = 100, years: float = 0.25,
+                           seconds: float = 10.0, readers: int = 4, batch_hours: int = 1) -> dict:
+    """
+    Concurrent ingest + report throughput under the "default" (rollback journal,
+    driver defaults) and "tuned" (WAL + pragmas, read-only reader pool) storage
+    profiles, each against a fresh copy of the same seeded database.
+    """
+    template = Path(db_path).with_suffix(".template.db")
+    if not template.exists():
+        engine = make_engine(f"sqlite:///{template}", "default")
+        create_all(engine=engine)
+        with sessionmaker(bind=engine, **SESSION_OPTS)() as db:
+            seed_database(db, locations, years)
+        engine.dispose()
+    results = {}
+    for profile in ("default", "tuned"):
+        for suffix in ("", "-wal", "-shm"):
+            Path(db_path + suffix).unlink(missing_ok=True)
+        shutil.copyfile(template, db_path)
+        results[profile] = _contend(db_path, profile, seconds, readers, batch_hours)
+        logger.info(f"{profile}: {results[profile]}")
+    return results
+
+async def _api_clients(base_url: str, loc_ids: list[int], seconds: float, concurrency: int,
+                       conditional: bool) -> dict:
+    import httpx
+    import random
+    stop_at = time.perf_counter() + seconds
+    lat: list[float] = []
+    codes: dict[int, int] = {}
+    yesterday = (datetime.now(timezone.utc) - timedelta(days=1)).date().isoformat()
+
+    def pick(rng: random.Random) -> str:
+        r = rng.random()
+        if r < 0.6:
+            return "/v1/latest"
+        if r < 0.8:
+            return f"/v1/daily?date={yesterday}"
+        if r < 0.9:
+            return f"/v1/latest?location_id={rng.choice(loc_ids)}"
+        return f"/v1/locations/{rng.choice(loc_ids)}/history"
+
+    async def client(i: int):
+        rng = random.Random(i)
+        etags: dict[str, str] = {}  # what a polling dashboard remembers
+        limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as c:
+            while time.perf_counter() < stop_at:
+                path = pick(rng)
+                headers = {"If-None-Match": etags[path]} if conditional and path in etags else {}
+                t0 = time.perf_counter()
+                resp = await c.get(path, headers=headers)
+                lat.append(time.perf_counter() - t0)
+                codes[resp.status_code] = codes.get(resp.status_code, 0) + 1
+                if "etag" in resp.headers:
+                    etags[path] = resp.headers["etag"]
+
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    lat.sort()
+    return {
+        "requests": len(lat),
+        "requests_per_sec": round(len(lat) / seconds, 1),
+        "p50_ms": round(lat[len(lat) // 2] * 1000, 2) if lat else 0.0,
+        "p95_ms": round(lat[int(len(lat) * 0.95)] * 1000, 2) if lat else 0.0,
+        "status": {str(k): v for k, v in sorted(codes.items())},
+    }
+
+def api_load(db_path: str = "bench_api.db", locations: int = 3000, days: float = 3.0,
+             seconds: float = 10.0, concurrency: int = 32, reseed: bool = True) -> dict:
+    """
+    Requests/sec against a local API over a seeded database: cache disabled,
+    cache enabled, and cache enabled with clients revalidating via If-None-Match.
+    """
+    from .api import start_api
+    if reseed:
+        Path(db_path).unlink(missing_ok=True)
+    engine = make_engine(f"sqlite:///{db_path}", "tuned")
+    create_all(engine=engine)
+    Session = sessionmaker(bind=engine, **SESSION_OPTS)
+    latest_cache.invalidate()
+    rolling.invalidate()
+    with Session() as db:
+        if reseed:
+            seed_database(db, locations, days / 365, alerts_per_location=0)
+        loc_ids = list(db.execute(select(Location.id)).scalars())
+
+    results = {"params": {"locations": len(loc_ids), "days": days, "seconds": seconds, "concurrency": concurrency}}
+    for name, cache_size, conditional in (("no_cache", 0, False), ("cache", 1024, False),
+                                          ("cache_if_none_match", 1024, True)):
+        srv = start_api(session_factory=Session, cache_size=cache_size)
+        try:
+            results[name] = asyncio.run(_api_clients(srv.base_url, loc_ids, seconds, concurrency, conditional))
+        finally:
+            srv.shutdown()
+        logger.info(f"API {name}: {results[name]}")
+    engine.dispose()
+    return results
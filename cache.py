@@ -0,0 +1,182 @@
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Iterable, NamedTuple
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from .config import get_settings
+
+MISS = object()  # "not cached" — distinct from a cached None meaning "no data for this location"
+
+def _utc(dt: datetime) -> datetime:
+    # SQLite hands back naive datetimes; everything stored is UTC
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+class LatestReading(NamedTuple):
+    location_id: int
+    provider: str
+    observed_at: datetime  # UTC
+    pm25_ugm3: float
+    aqi: int | None
+
+    @classmethod
+    def of(cls, r) -> "LatestReading":
+        """From a Reading or a RETURNING row with the same column names."""
+        return cls(r.location_id, r.provider, _utc(r.observed_at), r.pm25_ugm3, r.aqi)
+
+class LastAlert(NamedTuple):
+    location_id: int
+    metric: str
+    status: str
+    created_at: datetime  # UTC
+
+    @classmethod
+    def of(cls, a) -> "LastAlert":
+        return cls(a.location_id, a.metric, a.status, _utc(a.created_at))
+
+class _KeyedLRU:
+    """
+    Bounded LRU keyed by location_id. `complete` means the map was loaded for
+    every active location and nothing has been evicted since, so a miss can be
+    answered as "no data" without touching the database.
+    """
+    def __init__(self, max_entries: int, ttl_seconds: float, ts_field: str):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.ts_field = ts_field
+        self._d: OrderedDict[int, tuple] = OrderedDict()
+        self._loaded_at: float | None = None
+        self._complete = False
+
+    def _fresh(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    @property
+    def complete(self) -> bool:
+        return self._complete and self._fresh()
+
+    def get(self, key: int):
+        if not self._fresh():
+            # expired: drop everything rather than serve state another process may have changed
+            if self._d:
+                self.clear()
+            return MISS
+        if key in self._d:
+            self._d.move_to_end(key)
+            return self._d[key]
+        return None if self._complete else MISS
+
+    def put(self, value: tuple) -> None:
+        key = value.location_id
+        cur = self._d.get(key)
+        if cur is not None and getattr(cur, self.ts_field) > getattr(value, self.ts_field):
+            return  # late-arriving row; keep the newer one
+        self._d[key] = value
+        self._d.move_to_end(key)
+        while len(self._d) > self.max_entries:
+            self._d.popitem(last=False)
+            self._complete = False  # evicted: misses are no longer authoritative
+
+    def load(self, values: Iterable[tuple]) -> None:
+        self._d.clear()
+        self._loaded_at = time.monotonic()
+        self._complete = True
+        for v in values:
+            self.put(v)
+
+    def snapshot(self) -> dict[int, tuple] | None:
+        return dict(self._d) if self.complete else None
+
+    def discard(self, key: int) -> None:
+        self._d.pop(key, None)
+        self._complete = False
+
+    def clear(self) -> None:
+        self._d.clear()
+        self._loaded_at = None
+        self._complete = False
+
+class LatestStateCache:
+    """
+    Process-local latest Reading / last Alert per location. Written through by
+    ingest and the evaluator, warmed from the database at startup, bounded in
+    size and expired after `ttl_seconds` so writes from other processes are
+    eventually picked up.
+    """
+    def __init__(self, max_entries: int | None = None, ttl_seconds: float | None = None):
+        self._lock = threading.Lock()
+        self._limits = (max_entries, ttl_seconds)  # None = CACHE_MAX_LOCATIONS / CACHE_TTL_SECONDS on first use
+
+    def _lru(self, ts_field: str) -> _KeyedLRU:
+        max_entries, ttl_seconds = self._limits
+        settings = get_settings()
+        return _KeyedLRU(
+            settings.cache_max_locations if max_entries is None else max_entries,
+            settings.cache_ttl_seconds if ttl_seconds is None else ttl_seconds,
+            ts_field,
+        )
+
+    @cached_property
+    def readings(self) -> _KeyedLRU:
+        return self._lru("observed_at")
+
+    @cached_property
+    def alerts(self) -> _KeyedLRU:
+        return self._lru("created_at")
+
+    def warm(self, db: Session) -> None:
+        from .logic.reporter import latest_readings_by_location
+        from .logic.evaluator import last_alerts_by_location
+        self.invalidate()
+        readings = latest_readings_by_location(db)  # cold cache → loads and marks complete
+        alerts = last_alerts_by_location(db)
+        logger.info(f"Latest-state cache warmed: {len(readings)} readings, {len(alerts)} alerts")
+
+    def get_reading(self, location_id: int):
+        with self._lock:
+            return self.readings.get(location_id)
+
+    def get_alert(self, location_id: int):
+        with self._lock:
+            return self.alerts.get(location_id)
+
+    def all_readings(self) -> dict[int, LatestReading] | None:
+        with self._lock:
+            return self.readings.snapshot()
+
+    def all_alerts(self) -> dict[int, LastAlert] | None:
+        with self._lock:
+            return self.alerts.snapshot()
+
+    def load_readings(self, rows: Iterable) -> None:
+        with self._lock:
+            self.readings.load(LatestReading.of(r) for r in rows)
+
+    def load_alerts(self, rows: Iterable) -> None:
+        with self._lock:
+            self.alerts.load(LastAlert.of(a) for a in rows)
+
+    def put_readings(self, rows: Iterable) -> None:
+        with self._lock:
+            for r in rows:
+                self.readings.put(LatestReading.of(r))
+
+    def put_alerts(self, rows: Iterable) -> None:
+        with self._lock:
+            for a in rows:
+                self.alerts.put(LastAlert.of(a))
+
+    def invalidate(self, location_id: int | None = None) -> None:
+        with self._lock:
+            if location_id is None:
+                self.readings.clear()
+                self.alerts.clear()
+            else:
+                self.readings.discard(location_id)
+                self.alerts.discard(location_id)
+
+latest_cache = LatestStateCache()
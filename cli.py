@@ -1,65 +1,329 @@
 from __future__ import annotations
 import typer
-from apscheduler.schedulers.blocking import BlockingScheduler
 from datetime import datetime, timedelta, timezone
-from loguru import logger
-from .runner import run_once, send_morning_digest
-from zoneinfo import ZoneInfo
-from .db import create_all, SessionLocal
-from .logic.reporter import daily_summary, write_csv
+
+# Commands import what they need when they run: `report` shouldn't pay for
+# apscheduler/httpx/tenacity, and nothing should read config.yaml or open the
+# database just to print --help. `bench importtime` guards this.
 
 app = typer.Typer(add_completion=False)
+bench_app = typer.Typer(add_completion=False, help="Local performance benchmarks.")
+app.add_typer(bench_app, name="bench")
 
 @app.command()
 def init_db():
+    from .db import create_all
     create_all()
     typer.echo("DB initialized and locations seeded on first run.")
 
 @app.command()
 def run_once_cmd():
+    from .runner import run_once
     run_once()
 
 @app.command()
-def schedule(minutes: int = 60, delay_seconds: int = 0):
+def schedule(minutes: int = 60, delay_seconds: int = 0,
+             metrics_port: int = typer.Option(None, help="Serve /metrics on this port (default METRICS_PORT)"),
+             deadline_seconds: float = typer.Option(None, help="Per-ingest deadline (default 90% of the interval)"),
+             ingest: bool = typer.Option(None, "--ingest/--no-ingest",
+                                         help="Run the ingest job (default SCHEDULE_INGEST); turn off when `worker`s ingest")):
     """
     Hourly: ingest-only (no per-run emails).
     Daily: send 7:05am PT morning digest.
+    Ingest runs one-at-a-time on its own worker; an overrunning cycle makes the
+    next one coalesce/skip (logged) rather than pile up, and the digest has a
+    dedicated worker so a long ingest can't delay it. With --no-ingest (for a
+    sharded `worker` fleet) only the drain, digest and retention jobs run.
     """
-    sched = BlockingScheduler(timezone="America/Los_Angeles")
-    from datetime import datetime, timedelta
-    # Hourly ingestion job
-    start = datetime.now() + timedelta(seconds=delay_seconds)
-    sched.add_job(run_once, "interval", minutes=minutes, next_run_time=start)
-    # Daily digest at 7:05 AM PT
-    sched.add_job(send_morning_digest, "cron", hour=7, minute=5)
+    from functools import partial
+    from loguru import logger
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    from apscheduler.executors.pool import ThreadPoolExecutor
+    from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_ERROR
+    from .config import get_settings
+    from .metrics import instrument_job, start_metrics_server, job_runs
+    from .runner import bootstrap, run_once, send_morning_digest, drain_notifications, run_retention
+
+    bootstrap()  # schema, seeding and cache warm-up happen once, not on every tick
+    port = get_settings().metrics_port if metrics_port is None else metrics_port
+    if port:
+        start_metrics_server(port)
+    deadline = deadline_seconds or minutes * 60 * 0.9
+
+    sched = BlockingScheduler(
+        timezone="America/Los_Angeles",
+        executors={
+            "default": ThreadPoolExecutor(2),
+            "ingest": ThreadPoolExecutor(1),
+            "digest": ThreadPoolExecutor(1),
+        },
+    )
+
+    def on_event(event):
+        if event.code == EVENT_JOB_MAX_INSTANCES:
+            logger.warning(f"Job {event.job_id} still running; skipped overlapping run")
+            job_runs.inc(job=event.job_id, outcome="skipped_overlap")
+        elif event.code == EVENT_JOB_MISSED:
+            logger.warning(f"Job {event.job_id} missed its run time {event.scheduled_run_time}")
+            job_runs.inc(job=event.job_id, outcome="missed")
+        elif event.code == EVENT_JOB_ERROR:
+            logger.error(f"Job {event.job_id} failed: {event.exception!r}")
+    sched.add_listener(on_event, EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES | EVENT_JOB_ERROR)
+
+    # Hourly ingestion job, unless a `worker` fleet owns ingest
+    if get_settings().schedule_ingest if ingest is None else ingest:
+        start = datetime.now() + timedelta(seconds=delay_seconds)
+        sched.add_job(instrument_job("ingest", partial(run_once, deadline_seconds=deadline)), "interval",
+                      minutes=minutes, next_run_time=start, id="ingest", executor="ingest",
+                      max_instances=1, coalesce=True, misfire_grace_time=int(minutes * 60))
+    else:
+        logger.info("Ingest disabled in the scheduler; expecting `worker` processes to ingest")
+    # Alert outbox drain (coalesces per recipient, retries with backoff)
+    sched.add_job(instrument_job("drain_outbox", drain_notifications), "interval", minutes=1,
+                  id="drain_outbox", max_instances=1, coalesce=True)
+    # Daily digest at 7:05 AM PT; its own worker, and still sent if the process was busy/asleep at 7:05
+    sched.add_job(instrument_job("digest", send_morning_digest), "cron", hour=7, minute=5,
+                  id="digest", executor="digest", max_instances=1, coalesce=True, misfire_grace_time=3600)
+    if get_settings().retention_days > 0:
+        # Daily at 3:30 AM PT on the ingest worker, so pruning never overlaps an ingest write
+        sched.add_job(instrument_job("retention", run_retention), "cron", hour=3, minute=30,
+                      id="retention", executor="ingest", max_instances=1, coalesce=True, misfire_grace_time=6 * 3600)
     try:
         sched.start()
     except (KeyboardInterrupt, SystemExit):
         pass
 
 
+@app.command()
+def worker(shards: int = typer.Option(..., help="Total shard count; every worker in the fleet must agree"),
+           minutes: float = typer.Option(60, help="Ingest interval per shard"),
+           lease_seconds: float = typer.Option(90, help="Lease TTL; a dead worker's shards are taken over after this"),
+           poll_seconds: float = typer.Option(10, help="How often to claim/rebalance and look for due shards"),
+           max_shards: int = typer.Option(None, help="Cap on shards this worker holds")):
+    """
+    Sharded ingest: claim a fair share of location shards via database leases and ingest them on the interval.
+    Run one per core/host against the same DB_URL, and run `schedule --no-ingest`
+    (or SCHEDULE_INGEST=false) alongside for the outbox drain and digests.
+    """
+    import signal
+    from .runner import bootstrap
+    from .shards import ShardWorker
+
+    bootstrap()
+    w = ShardWorker(shards, minutes, lease_seconds, poll_seconds, max_shards)
+    signal.signal(signal.SIGTERM, lambda *_: w.stop())
+    try:
+        w.run()
+    except KeyboardInterrupt:
+        w.stop()
 
 @app.command()
-def report(date: str = typer.Argument(None)):
+def serve(host: str = typer.Option(None, help="Default API_HOST"),
+          port: int = typer.Option(None, help="Default API_PORT")):
+    """
+    Serve the read API: /v1/latest, /v1/locations, /v1/locations/{id}/history, /v1/daily.
+    """
+    import asyncio
+    from .config import get_settings
+    from .db import create_all
+    from .api import ApiServer
+
+    settings = get_settings()
+    create_all()
+    try:
+        asyncio.run(ApiServer().serve_forever(host or settings.api_host, port or settings.api_port))
+    except KeyboardInterrupt:
+        pass
+
+@app.command()
+def report(date: str = typer.Argument(None),
+           start: str = typer.Option(None, help="Range start YYYY-MM-DD (inclusive)"),
+           end: str = typer.Option(None, help="Range end YYYY-MM-DD (inclusive)"),
+           fmt: str = typer.Option("csv", "--format", help="csv or parquet (range mode)"),
+           split: str = typer.Option("none", help="none, day or month (range mode)"),
+           out_dir: str = typer.Option("reports")):
+    from .db import ReadSession
+    if start:
+        from datetime import date as _date
+        from .logic.export import export_range
+        first = _date.fromisoformat(start)
+        last = _date.fromisoformat(end) if end else first
+        with ReadSession() as db:
+            paths = export_range(db, first, last + timedelta(days=1), out_dir, fmt=fmt, split=split)
+        typer.echo(f"Wrote {len(paths)} file(s) to {out_dir}/")
+        return
     if date:
         y, m, d = map(int, date.split("-"))
         target = datetime(y, m, d, tzinfo=timezone.utc)
     else:
         target = datetime.now(timezone.utc) - timedelta(days=1)
         target = datetime(target.year, target.month, target.day, tzinfo=timezone.utc)
-    with SessionLocal() as db:
+    from .logic.reporter import daily_summary, write_csv
+    with ReadSession() as db:
         rows = daily_summary(db, target)
-    path = f"reports/{target.date().isoformat()}_summary.csv"
+    path = f"{out_dir}/{target.date().isoformat()}_summary.csv"
     write_csv(path, rows)
     typer.echo(f"Wrote {path}")
 
+@app.command()
+def drain_outbox_now():
+    """
+    Send every pending alert notification now, ignoring the coalescing window.
+    """
+    from .db import create_all
+    from .runner import drain_notifications
+    create_all()
+    drain_notifications(flush=True)
+
+@app.command()
+def backfill_rollups(start: str = typer.Option(None, help="YYYY-MM-DD (inclusive)"),
+                     end: str = typer.Option(None, help="YYYY-MM-DD (exclusive)")):
+    """
+    Rebuild daily_rollups from raw readings (all history by default).
+    """
+    from datetime import date
+    from .db import create_all, SessionLocal
+    from .store import backfill_rollups as _backfill
+    create_all()
+    with SessionLocal() as db:
+        n = _backfill(db,
+                      date.fromisoformat(start) if start else None,
+                      date.fromisoformat(end) if end else None)
+    typer.echo(f"Rebuilt rollups ({n} location-day upserts).")
+
+@app.command()
+def fix_airnow_times(before: str = typer.Option(..., help="ISO time the fixed AirNow parser was deployed; older rows are repaired"),
+                     host_tz: str = typer.Option("UTC", help="Time zone of the host that ran the old ingest"),
+                     area_tz: str = typer.Option("America/Los_Angeles", help="Time zone of the AirNow reporting areas")):
+    """
+    Re-stamp AirNow readings stored by the old parser (local hour read in the host's zone) and drop duplicates.
+    Run once, after deploying the fixed parser.
+    """
+    import json
+    from .db import create_all, SessionLocal
+    from .store import fix_airnow_times as _fix
+    create_all()
+    when = datetime.fromisoformat(before)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    with SessionLocal() as db:
+        typer.echo(json.dumps(_fix(db, when, host_tz, area_tz), indent=2))
+
+@app.command()
+def archive(older_than_days: int = typer.Option(None, help="Default RETENTION_DAYS"),
+            vacuum: bool = typer.Option(True, help="VACUUM after pruning")):
+    """
+    Move readings from months older than the retention age into per-month Parquet files and prune them.
+    """
+    from .db import create_all, SessionLocal
+    from .archive import archive_readings
+    create_all()
+    with SessionLocal() as db:
+        result = archive_readings(db, older_than_days, run_vacuum=vacuum)
+    typer.echo(f"Archived {result['rows']} readings from {result['months']} month(s).")
+
+@app.command()
+def check_plans():
+    """
+    Fail (exit 1) if any hot readings/alerts query plans a full table scan.
+    """
+    from .db import create_all, ReadSession
+    from .query_plans import full_table_scans
+    create_all()
+    with ReadSession() as db:
+        bad = full_table_scans(db)
+    for name, lines in bad.items():
+        typer.echo(f"{name}: " + "; ".join(lines))
+    if bad:
+        raise typer.Exit(code=1)
+    typer.echo("All hot queries use indexes.")
+
 @app.command()
 def digest_now():
     """
     Send the Morning Digest email immediately (useful for testing).
     """
+    from .runner import send_morning_digest
     send_morning_digest()
 
+@bench_app.command("smtp")
+def bench_smtp(messages: int = 200, port: int = 8025):
+    """
+    Messages/sec against a local aiosmtpd sink: per-message vs one pooled session.
+    """
+    import json
+    from .bench import smtp_throughput
+    typer.echo(json.dumps(smtp_throughput(messages, port), indent=2))
+
+@bench_app.command("run")
+def bench_run(db_path: str = "bench.db", locations: int = 100, years: float = 1.0,
+              latency_ms: float = 50.0, error_rate: float = 0.01, repeat: int = 3,
+              out: str = "bench_results.json", reseed: bool = True):
+    """
+    Seed a synthetic DB and time ingest, evaluation, digest and daily summary; writes JSON.
+    """
+    import json
+    from .bench import run_suite
+    report = run_suite(db_path, locations, years, latency_ms, error_rate, repeat, out, reseed)
+    typer.echo(json.dumps(report["scenarios"], indent=2))
+
+@bench_app.command("standin")
+def bench_standin(port: int = 8088, latency_ms: float = 0.0, error_rate: float = 0.0):
+    """
+    Serve AirNow/OpenAQ-shaped JSON locally (point AIRNOW_BASE_URL / OPENAQ_BASE_URL at it).
+    """
+    import time
+    from .standin import start_standin
+    srv = start_standin(port, latency_ms, latency_ms / 2, error_rate)
+    typer.echo(f"Stand-in listening on {srv.base_url}; Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
+
+@bench_app.command("parse")
+def bench_parse(iterations: int = 2000):
+    """
+    AirNow payload parsing: original dateutil/pydantic path vs fast path.
+    """
+    import json
+    from .bench import parse_throughput
+    typer.echo(json.dumps(parse_throughput(iterations), indent=2))
+
+@bench_app.command("concurrency")
+def bench_concurrency(db_path: str = "bench_concurrency.db", locations: int = 100, years: float = 0.25,
+                      seconds: float = 10.0, readers: int = 4, batch_hours: int = 1):
+    """
+    Concurrent ingest + report throughput: default SQLite settings vs the tuned WAL profile.
+    """
+    import json
+    from .bench import concurrency_throughput
+    typer.echo(json.dumps(concurrency_throughput(db_path, locations, years, seconds, readers, batch_hours), indent=2))
+
+@bench_app.command("api")
+def bench_api(db_path: str = "bench_api.db", locations: int = 3000, days: float = 3.0,
+              seconds: float = 10.0, concurrency: int = 32, reseed: bool = True):
+    """
+    Load-test the read API: requests/sec without cache, with cache, and with If-None-Match polling.
+    """
+    import json
+    from .bench import api_load
+    typer.echo(json.dumps(api_load(db_path, locations, days, seconds, concurrency, reseed), indent=2))
+
+@bench_app.command("importtime")
+def bench_importtime(module: str = typer.Option(None, help="Module to import (default: this CLI)"),
+                     budget_ms: float = 150.0, repeat: int = 5):
+    """
+    Fail (exit 1) if importing the CLI exceeds the startup budget or loads a heavy dependency eagerly.
+    """
+    import json
+    from .bench import import_time
+    result = import_time(module, budget_ms, repeat)
+    typer.echo(json.dumps(result, indent=2))
+    if not result["ok"]:
+        raise typer.Exit(code=1)
+
 if __name__ == "__main__":
     app()
 
@@ -1,10 +1,9 @@
 from __future__ import annotations
-import os, yaml
+import os
+from functools import lru_cache
 from pathlib import Path
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from dotenv import load_dotenv
-load_dotenv()
 
 
 class LocationCfg(BaseModel):
@@ -20,34 +19,94 @@ class QuietHoursCfg(BaseModel):
     start: str = "22:00"
     end: str = "07:00"
 
+class SubscriberCfg(BaseModel):
+    email: str
+    cities: List[str] | None = None  # None = every active city
+    threshold_pm25: float | None = None  # None = ALERT_DEFAULT_THRESHOLD_PM25
+
 class AppCfg(BaseModel):
     poll_interval_minutes: int = 60
     locations: List[LocationCfg]
+    subscribers: List[SubscriberCfg] = Field(default_factory=list)  # personalised digests; else EMAIL_TO
     notify: NotifyCfg = NotifyCfg()
     dedupe_minutes: int = 180
     quiet_hours: QuietHoursCfg = QuietHoursCfg()
 
 class Settings(BaseModel):
-    provider: str = os.getenv("PROVIDER", "airnow")
-    airnow_api_key: Optional[str] = os.getenv("AIRNOW_API_KEY")
-    db_url: str = os.getenv("DB_URL", "sqlite:///aqi.db")
-    default_threshold_pm25: float = float(os.getenv("ALERT_DEFAULT_THRESHOLD_PM25", "35"))
-    quiet_start: str = os.getenv("QUIET_HOURS_START", "22:00")
-    quiet_end: str = os.getenv("QUIET_HOURS_END", "07:00")
-    dedupe_minutes: int = int(os.getenv("DEDUPE_MINUTES", "180"))
-
-    email_enabled: bool = os.getenv("EMAIL_ENABLED", "true").lower() == "true"
-    email_host: str = os.getenv("EMAIL_SMTP_HOST", "smtp.gmail.com")
-    email_port: int = int(os.getenv("EMAIL_SMTP_PORT", "587"))
-    email_user: Optional[str] = os.getenv("EMAIL_USERNAME")
-    email_pass: Optional[str] = os.getenv("EMAIL_PASSWORD")
-    email_from: str = os.getenv("EMAIL_FROM", "alerts@wildfire.local")
-    email_to: List[str] = [x.strip() for x in os.getenv("EMAIL_TO", "").split(",") if x.strip()]
+    # default_factory so the environment is read when get_settings() builds this, after .env is loaded
+    provider: str = Field(default_factory=lambda: os.getenv("PROVIDER", "airnow"))  # comma-separated, e.g. "airnow,openaq"
+    airnow_api_key: Optional[str] = Field(default_factory=lambda: os.getenv("AIRNOW_API_KEY"))
+    airnow_base_url: str = Field(default_factory=lambda: os.getenv("AIRNOW_BASE_URL", "https://www.airnowapi.org"))
+    openaq_api_key: Optional[str] = Field(default_factory=lambda: os.getenv("OPENAQ_API_KEY"))
+    openaq_base_url: str = Field(default_factory=lambda: os.getenv("OPENAQ_BASE_URL", "https://api.openaq.org"))
+    db_url: str = Field(default_factory=lambda: os.getenv("DB_URL", "sqlite:///aqi.db"))
+    db_profile: str = Field(default_factory=lambda: os.getenv("DB_PROFILE", "tuned"))  # "tuned" or "default" (driver defaults)
+    sqlite_busy_timeout_ms: int = Field(default_factory=lambda: int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000")))
+    sqlite_mmap_mb: int = Field(default_factory=lambda: int(os.getenv("SQLITE_MMAP_MB", "256")))
+    sqlite_cache_mb: int = Field(default_factory=lambda: int(os.getenv("SQLITE_CACHE_MB", "64")))
+    alert_pm25_basis: str = Field(default_factory=lambda: os.getenv("ALERT_PM25_BASIS", "latest"))  # "latest" or "nowcast"
+    default_threshold_pm25: float = Field(default_factory=lambda: float(os.getenv("ALERT_DEFAULT_THRESHOLD_PM25", "35")))
+    quiet_start: str = Field(default_factory=lambda: os.getenv("QUIET_HOURS_START", "22:00"))
+    quiet_end: str = Field(default_factory=lambda: os.getenv("QUIET_HOURS_END", "07:00"))
+    dedupe_minutes: int = Field(default_factory=lambda: int(os.getenv("DEDUPE_MINUTES", "180")))
+    ingest_concurrency: int = Field(default_factory=lambda: int(os.getenv("INGEST_CONCURRENCY", "16")))
+    http_timeout_seconds: float = Field(default_factory=lambda: float(os.getenv("HTTP_TIMEOUT_SECONDS", "20")))
+    provider_timeout_seconds: float = Field(default_factory=lambda: float(os.getenv("PROVIDER_TIMEOUT_SECONDS", "600")))
+    cluster_cell_miles: float = Field(default_factory=lambda: float(os.getenv("CLUSTER_CELL_MILES", "10")))
+    provider_cache_size: int = Field(default_factory=lambda: int(os.getenv("PROVIDER_CACHE_SIZE", "4096")))
+    provider_cache_path: Optional[str] = Field(default_factory=lambda: os.getenv("PROVIDER_CACHE_PATH"))
+    provider_cache_grace_minutes: int = Field(default_factory=lambda: int(os.getenv("PROVIDER_CACHE_GRACE_MINUTES", "10")))
+    schedule_ingest: bool = Field(default_factory=lambda: os.getenv("SCHEDULE_INGEST", "true").lower() in ("1", "true", "yes"))
+    retention_days: int = Field(default_factory=lambda: int(os.getenv("RETENTION_DAYS", "0")))  # 0 keeps every reading hot
+    archive_dir: str = Field(default_factory=lambda: os.getenv("ARCHIVE_DIR", "archive"))
+    api_host: str = Field(default_factory=lambda: os.getenv("API_HOST", "127.0.0.1"))
+    api_port: int = Field(default_factory=lambda: int(os.getenv("API_PORT", "8080")))
+    api_cache_size: int = Field(default_factory=lambda: int(os.getenv("API_CACHE_SIZE", "1024")))  # 0 disables
+    api_version_poll_seconds: float = Field(default_factory=lambda: float(os.getenv("API_VERSION_POLL_SECONDS", "1")))
+    metrics_port: int = Field(default_factory=lambda: int(os.getenv("METRICS_PORT", "0")))  # 0 disables /metrics
+    profile_dir: Optional[str] = Field(default_factory=lambda: os.getenv("PROFILE_DIR"))  # cProfile dump per scheduler job run
+    cache_max_locations: int = Field(default_factory=lambda: int(os.getenv("CACHE_MAX_LOCATIONS", "10000")))
+    cache_ttl_seconds: float = Field(default_factory=lambda: float(os.getenv("CACHE_TTL_SECONDS", "3600")))
+
+    email_enabled: bool = Field(default_factory=lambda: os.getenv("EMAIL_ENABLED", "true").lower() == "true")
+    email_host: str = Field(default_factory=lambda: os.getenv("EMAIL_SMTP_HOST", "smtp.gmail.com"))
+    email_port: int = Field(default_factory=lambda: int(os.getenv("EMAIL_SMTP_PORT", "587")))
+    email_user: Optional[str] = Field(default_factory=lambda: os.getenv("EMAIL_USERNAME"))
+    email_pass: Optional[str] = Field(default_factory=lambda: os.getenv("EMAIL_PASSWORD"))
+    email_from: str = Field(default_factory=lambda: os.getenv("EMAIL_FROM", "alerts@wildfire.local"))
+    email_to: List[str] = Field(default_factory=lambda: [x.strip() for x in os.getenv("EMAIL_TO", "").split(",") if x.strip()])
+    email_starttls: bool = Field(default_factory=lambda: os.getenv("EMAIL_STARTTLS", "true").lower() == "true")
+    notify_coalesce_seconds: int = Field(default_factory=lambda: int(os.getenv("NOTIFY_COALESCE_SECONDS", "120")))
+    notify_max_attempts: int = Field(default_factory=lambda: int(os.getenv("NOTIFY_MAX_ATTEMPTS", "6")))
+    notify_retry_base_seconds: int = Field(default_factory=lambda: int(os.getenv("NOTIFY_RETRY_BASE_SECONDS", "60")))
 
 def load_app_config(path: str | Path = "config.yaml") -> AppCfg:
+    import yaml
     with open(path, "r") as f:
         data = yaml.safe_load(f) or {}
     return AppCfg(**data)
 
-settings = Settings()
-app_cfg = load_app_config()
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Load .env and build Settings on first use; shared by the whole process."""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return Settings()
+
+@lru_cache(maxsize=None)
+def get_app_config(path: str = "config.yaml") -> AppCfg:
+    """Parse config.yaml on first use. A missing file means no configured locations, not a crash."""
+    try:
+        return load_app_config(path)
+    except FileNotFoundError:
+        from loguru import logger
+        logger.warning(f"{path} not found; continuing with no configured locations or subscribers")
+        return AppCfg(locations=[])
+
+def __getattr__(name: str):
+    # `from .config import settings` keeps working, but resolves on first access rather than at import
+    if name == "settings":
+        return get_settings()
+    if name == "app_cfg":
+        return get_app_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,16 +1,128 @@
 from __future__ import annotations
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from functools import lru_cache
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker, DeclarativeBase
+from loguru import logger
 
-from .config import settings
+from .config import get_settings
 
 class Base(DeclarativeBase): pass
 
-_engine = create_engine(settings.db_url, future=True)
-SessionLocal = sessionmaker(bind=_engine, autoflush=False, expire_on_commit=False, future=True)
+def _is_file_sqlite(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url and not url.rstrip("/").endswith(":")
 
-def get_engine():
-    return _engine
+def _tune_sqlite(engine: Engine, read_only: bool) -> None:
+    """
+    Per-connection pragmas for the "tuned" profile. WAL lets readers run
+    against the last committed snapshot while ingest writes, and
+    synchronous=NORMAL is durable across application crashes in WAL mode
+    (only an OS crash can lose the last commits).
+    """
+    settings = get_settings()
+    pragmas = [
+        "journal_mode=WAL",
+        "synchronous=NORMAL",
+        f"busy_timeout={settings.sqlite_busy_timeout_ms}",
+        f"mmap_size={settings.sqlite_mmap_mb * 1024 * 1024}",
+        f"cache_size=-{settings.sqlite_cache_mb * 1024}",  # negative = KiB
+        "temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("query_only=ON")  # last, so the journal_mode switch above is still allowed
 
-def create_all(base=Base):
-    base.metadata.create_all(_engine)
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        for p in pragmas:
+            cur.execute(f"PRAGMA {p}")
+        cur.close()
+
+def make_engine(url: str, profile: str | None = None, read_only: bool = False) -> Engine:
+    """
+    Engine for `url` under a storage profile (DB_PROFILE by default). Only
+    file-backed SQLite is tuned; other databases get driver defaults.
+    """
+    profile = profile or get_settings().db_profile
+    if profile == "tuned" and _is_file_sqlite(url):
+        timeout = get_settings().sqlite_busy_timeout_ms / 1000
+        engine = create_engine(url, future=True, connect_args={"timeout": timeout, "check_same_thread": False})
+        _tune_sqlite(engine, read_only)
+        return engine
+    return create_engine(url, future=True)
+
+@lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """Write engine, created on first use so importing models or the CLI never opens DB_URL."""
+    return make_engine(get_settings().db_url)
+
+@lru_cache(maxsize=None)
+def get_read_engine() -> Engine:
+    """
+    Separate pool of query_only connections for reports and digests. Under WAL
+    they read the last committed snapshot instead of queueing behind ingest.
+    Falls back to the write engine where a second pool wouldn't help.
+    """
+    settings = get_settings()
+    if settings.db_profile != "tuned" or not _is_file_sqlite(settings.db_url):
+        return get_engine()
+    return make_engine(settings.db_url, read_only=True)
+
+SESSION_OPTS = dict(autoflush=False, expire_on_commit=False, future=True)
+
+@lru_cache(maxsize=None)
+def get_sessionmaker() -> sessionmaker:
+    return sessionmaker(bind=get_engine(), **SESSION_OPTS)
+
+@lru_cache(maxsize=None)
+def get_read_sessionmaker() -> sessionmaker:
+    return sessionmaker(bind=get_read_engine(), **SESSION_OPTS)
+
+def SessionLocal(**kw):
+    """Read-write session (ingest, evaluator, outbox, migrations)."""
+    return get_sessionmaker()(**kw)
+
+def ReadSession(**kw):
+    """Read-only session for reporting paths; writes fail with 'attempt to write a readonly database'."""
+    return get_read_sessionmaker()(**kw)
+
+def create_all(base=Base, engine=None):
+    from . import models  # noqa: F401  (registers the tables; callers like `init-db` may not have imported them)
+    engine = engine or get_engine()
+    base.metadata.create_all(engine)
+    ensure_indexes(base, engine)
+    if base is Base:
+        ensure_rollups(engine)
+
+# Indexes older versions created that are now redundant; dropped so they stop costing writes
+RETIRED_INDEXES = ("ix_readings_location_observed",)  # duplicated uq_reading_unique's prefix
+
+def ensure_indexes(base=Base, engine=None):
+    """
+    create_all() only emits indexes for tables it creates, so databases made by
+    older versions never get new ones. Create any declared index that's missing
+    and drop retired ones.
+    """
+    engine = engine or get_engine()
+    for table in base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    if base is Base:
+        with engine.begin() as conn:
+            for name in RETIRED_INDEXES:
+                conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+
+def ensure_rollups(engine=None):
+    """
+    Reports read only daily_rollups, which is empty on a database that had
+    readings before the table existed. Backfill it once in that case.
+    """
+    from .models import DailyRollup, Reading
+    from .store import backfill_rollups
+    with Session(engine or get_engine()) as db:
+        if db.execute(select(DailyRollup.location_id).limit(1)).first() is not None:
+            return
+        if db.execute(select(Reading.id).limit(1)).first() is None:
+            return
+        logger.info("daily_rollups is empty but readings exist; backfilling rollups")
+        backfill_rollups(db)
@@ -0,0 +1,116 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from html import escape
+from itertools import islice
+from string import Template
+from typing import Iterable, Iterator
+
+# Compiled once at import; per-render work is substitution + joins only.
+HEADER = Template("""
+    <html><body>
+    <h2 style="font-family:system-ui;margin-bottom:4px;">Daily Air Quality Digest</h2>
+    <div style="color:#555;font-family:system-ui;margin-bottom:14px;">
+      $when
+      &nbsp;|&nbsp; Threshold: $threshold µg/m³ (PM2.5)
+    </div>
+    <table cellpadding="8" cellspacing="0" border="0" style="border-collapse:collapse;font-family:system-ui;font-size:14px;">
+      <thead>
+        <tr style="background:#f1f3f5;">
+          <th align="left">City</th>
+          <th align="right">Now PM2.5</th>
+          <th align="right">NowCast</th>
+          <th align="left">Now Category</th>
+          <th align="right">Δ vs Thresh</th>
+          <th align="right">Yday Max</th>
+          <th align="right">Yday Avg</th>
+          <th align="left">Status</th>
+        </tr>
+      </thead>
+      <tbody>
+    """)
+ROW = Template("""
+          <tr style="border-bottom:1px solid #eee;">
+            <td>$city</td>
+            <td align="right" style="font-variant-numeric:tabular-nums;">$pm25</td>
+            <td align="right" style="font-variant-numeric:tabular-nums;">$nowcast</td>
+            <td>$badge $category</td>
+            <td align="right">$delta</td>
+            <td align="right" style="font-variant-numeric:tabular-nums;">$y_max</td>
+            <td align="right" style="font-variant-numeric:tabular-nums;">$y_avg</td>
+            <td style="color:$status_color;">$status</td>
+          </tr>
+        """)
+TAIL = """
+      </tbody>
+    </table>
+    <div style="color:#666;font-size:12px;margin-top:10px;font-family:system-ui;">
+      Source: AirNow. “Now” uses most recently ingested PM2.5; the category
+      follows the EPA NowCast when available; “Yday” aggregates cover the previous UTC day.
+    </div>
+    </body></html>
+    """
+
+def fmt_val(v: float | None) -> str:
+    return f"{v:.1f}" if v is not None else "—"
+
+def fmt_delta(d: float | None) -> str:
+    if d is None:
+        return "—"
+    sign = "+" if d >= 0 else "–"
+    color = "#c92a2a" if d >= 0 else "#2b8a3e"
+    return f"<span style='color:{color};font-variant-numeric:tabular-nums;'>{sign}{abs(d):.1f}</span>"
+
+@lru_cache(maxsize=4096)
+def render_row(city: str, pm25: float | None, category: str, badge: str,
+               y_max: float | None, y_avg: float | None, threshold: float,
+               nowcast: float | None = None) -> str:
+    """
+    One city's <tr>. Cached: every subscriber sharing a city and threshold
+    reuses the same fragment, so a digest run renders each distinct row once.
+    """
+    delta = pm25 - threshold if pm25 is not None else None
+    above = delta is not None and delta >= 0
+    return ROW.substitute(
+        city=escape(city), pm25=fmt_val(pm25), nowcast=fmt_val(nowcast), badge=badge, category=category,
+        delta=fmt_delta(delta), y_max=fmt_val(y_max), y_avg=fmt_val(y_avg),
+        status="Above" if above else "Below", status_color="#c92a2a" if above else "#2b8a3e",
+    )
+
+@lru_cache(maxsize=64)
+def render_header(when: str, threshold: float) -> str:
+    return HEADER.substitute(when=when, threshold=f"{threshold:.0f}")
+
+def render_digest(rows: list[dict], threshold: float, now_local: datetime) -> str:
+    """Assemble a digest from cached fragments; `rows` as built by build_morning_digest_rows."""
+    when = f"{now_local:%A, %B %d, %Y • %I:%M %p %Z}"
+    body = [
+        render_row(r["city"], r["pm25_now"], r["category_now"], r["badge"], r["y_max"], r["y_avg"], threshold,
+                   r.get("pm25_nowcast"))
+        for r in rows
+    ]
+    return render_header(when, threshold) + "\n".join(body) + TAIL
+
+def render_for_subscriber(rows: list[dict], sub, default_threshold: float, now_local: datetime) -> tuple[str, str]:
+    """(email, html) for one subscriber: their own cities (all if unset) and threshold."""
+    threshold = sub.threshold_pm25 if sub.threshold_pm25 is not None else default_threshold
+    if sub.cities:
+        wanted = set(sub.cities)
+        rows = [r for r in rows if r["city"] in wanted]
+    return sub.email, render_digest(rows, threshold, now_local)
+
+def iter_subscriber_digests(rows: list[dict], subscribers: Iterable, default_threshold: float,
+                            now_local: datetime, workers: int = 4, chunk: int = 256) -> Iterator[tuple[str, str]]:
+    """
+    Yield (email, html) for each subscriber, rendering `chunk` at a time on a
+    thread pool. Only one chunk of HTML is alive at once, so memory stays
+    bounded however long the subscriber list is.
+    """
+    it = iter(subscribers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(it, chunk))
+            if not batch:
+                return
+            yield from pool.map(lambda s: render_for_subscriber(rows, s, default_threshold, now_local), batch)
@@ -1,29 +1,125 @@
 from __future__ import annotations
 import smtplib
+import time
 from email.mime.text import MIMEText
-from typing import List
+from typing import List, Iterable
 from loguru import logger
-from ..config import settings
+from ..config import get_settings
 from .base_notifier import BaseNotifier
-from email.mime.multipart import MIMEMultipart  
+from ..metrics import smtp_send_seconds, smtp_sends
+from email.mime.multipart import MIMEMultipart
+
+def build_message(subject: str, body: str, recipients: List[str], content_type: str = "plain"):
+    if content_type == "html":
+        msg = MIMEMultipart("alternative")
+        part = MIMEText(body, "html")
+        msg.attach(part)
+    else:
+        msg = MIMEText(body, "plain")
+
+    msg["Subject"] = subject
+    msg["From"] = get_settings().email_from
+    msg["To"] = ", ".join(recipients)
+    return msg
+
+class SmtpConnection:
+    """
+    One authenticated SMTP session reused across many messages.
+    Reconnects (STARTTLS + LOGIN again) once if the server dropped us.
+    """
+    def __init__(self, host: str | None = None, port: int | None = None, starttls: bool | None = None):
+        settings = get_settings()
+        self.host = host or settings.email_host
+        self.port = port or settings.email_port
+        self.starttls = settings.email_starttls if starttls is None else starttls
+        self._server: smtplib.SMTP | None = None
+
+    def open(self) -> None:
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()
+        settings = get_settings()
+        if settings.email_user:
+            server.login(settings.email_user, settings.email_pass)
+        self._server = server
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            pass
+        self._server = None
+
+    def sendmail(self, recipients: List[str], msg) -> None:
+        t0 = time.perf_counter()
+        try:
+            self._sendmail(recipients, msg)
+        except Exception:
+            smtp_sends.inc(outcome="error")
+            raise
+        finally:
+            smtp_send_seconds.observe(time.perf_counter() - t0)
+        smtp_sends.inc(outcome="ok")
+
+    def _sendmail(self, recipients: List[str], msg) -> None:
+        if self._server is None:
+            self.open()
+        try:
+            self._server.sendmail(get_settings().email_from, recipients, msg.as_string())
+        except (smtplib.SMTPServerDisconnected, smtplib.SMTPSenderRefused, OSError):
+            # stale or dropped session: reconnect and retry once
+            self.close()
+            self.open()
+            self._server.sendmail(get_settings().email_from, recipients, msg.as_string())
+
+    def __enter__(self) -> "SmtpConnection":
+        self.open()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
 
 class EmailNotifier(BaseNotifier):
+    def __init__(self, host: str | None = None, port: int | None = None, starttls: bool | None = None):
+        self.host, self.port, self.starttls = host, port, starttls
+
+    def connection(self) -> SmtpConnection:
+        return SmtpConnection(self.host, self.port, self.starttls)
+
     def send(self, subject: str, body: str, recipients: List[str], content_type: str = "plain") -> None:
-        if not settings.email_enabled or not recipients:
+        if not get_settings().email_enabled or not recipients:
             return
-        if content_type == "html":
-            msg = MIMEMultipart("alternative")
-            part = MIMEText(body, "html")
-            msg.attach(part)
-        else:
-            msg = MIMEText(body, "plain")
-
-        msg["Subject"] = subject
-        msg["From"] = settings.email_from
-        msg["To"] = ", ".join(recipients)
-
-        with smtplib.SMTP(settings.email_host, settings.email_port) as server:
-            server.starttls()
-            server.login(settings.email_user, settings.email_pass)
-            server.sendmail(settings.email_from, recipients, msg.as_string())
+        msg = build_message(subject, body, recipients, content_type)
+        with self.connection() as conn:
+            conn.sendmail(recipients, msg)
         logger.info(f"Email sent to {recipients}: {subject}")
+
+    def send_many(self, messages: Iterable[tuple[str, str, List[str], str]]) -> tuple[int, int]:
+        """
+        Send (subject, body, recipients, content_type) tuples over one SMTP
+        session. A message that fails (refused recipient, dropped session) is
+        logged and skipped; the session is reopened for the next one if needed.
+        Returns (sent, failed).
+        """
+        if not get_settings().email_enabled:
+            return 0, 0
+        sent = failed = 0
+        conn = self.connection()  # opened on the first send
+        try:
+            for subject, body, recipients, content_type in messages:
+                if not recipients:
+                    continue
+                try:
+                    conn.sendmail(recipients, build_message(subject, body, recipients, content_type))
+                    sent += 1
+                except Exception as e:
+                    failed += 1
+                    logger.error(f"Email to {recipients} failed: {e!r}")
+                    if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                        conn.close()
+        finally:
+            conn.close()
+        logger.info(f"Email batch: {sent} sent, {failed} failed")
+        return sent, failed
@@ -6,69 +6,132 @@ from zoneinfo import ZoneInfo
 from loguru import logger
 
 from ..models import Reading, Alert, Location
-from ..config import settings
+from ..config import get_settings
+from ..cache import latest_cache, LatestReading, LastAlert, MISS
+from ..metrics import timed_query, alerts_total
+from ..rolling import rolling
+from .reporter import latest_readings_by_location
+from .normalize import within_quiet_hours
 
-def latest_reading_for_location(db: Session, location_id: int) -> Reading | None:
-    return db.execute(
-        select(Reading).where(Reading.location_id == location_id).order_by(desc(Reading.observed_at)).limit(1)
-    ).scalar_one_or_none()
+def latest_reading_stmt(location_id: int):
+    return select(Reading).where(Reading.location_id == location_id).order_by(desc(Reading.observed_at)).limit(1)
+
+@timed_query
+def latest_reading_for_location(db: Session, location_id: int) -> LatestReading | None:
+    hit = latest_cache.get_reading(location_id)
+    if hit is not MISS:
+        return hit
+    row = db.execute(latest_reading_stmt(location_id)).scalar_one_or_none()
+    if row is None:
+        return None
+    latest_cache.put_readings([row])
+    return LatestReading.of(row)
 
 def _to_utc(dt: datetime) -> datetime:
     if dt.tzinfo is None:
         return dt.replace(tzinfo=timezone.utc)  # treat stored values as UTC
     return dt.astimezone(timezone.utc)
 
-def should_dedupe(db: Session, location_id: int, metric: str, dedupe_minutes: int) -> bool:
-    cutoff = datetime.now(timezone.utc) - timedelta(minutes=dedupe_minutes)
-    row = db.execute(
+def last_alert_stmt(location_id: int):
+    return (
         select(Alert).where(Alert.location_id == location_id)
                      .order_by(desc(Alert.created_at))
                      .limit(1)
-    ).scalar_one_or_none()
-    if not row or row.metric != metric or row.status != "fired":
+    )
+
+def last_alerts_stmt():
+    """Most recent alert per active location in one query (index seek per location)."""
+    last_id = (
+        select(Alert.id)
+        .where(Alert.location_id == Location.id)
+        .order_by(desc(Alert.created_at))
+        .limit(1)
+        .correlate(Location)
+        .scalar_subquery()
+    )
+    return (
+        select(Alert)
+        .join(Location, Alert.location_id == Location.id)
+        .where(Location.active.is_(True), Alert.id == last_id)
+    )
+
+@timed_query
+def last_alerts_by_location(db: Session) -> dict[int, LastAlert]:
+    cached = latest_cache.all_alerts()
+    if cached is not None:
+        return cached
+    rows = db.execute(last_alerts_stmt()).scalars().all()
+    latest_cache.load_alerts(rows)
+    return {a.location_id: LastAlert.of(a) for a in rows}
+
+def _is_dedupe(last: LastAlert | Alert | None, metric: str, cutoff: datetime) -> bool:
+    if not last or last.metric != metric or last.status != "fired":
         return False
-    created = _to_utc(row.created_at)
-    return created >= cutoff
+    return _to_utc(last.created_at) >= cutoff
 
+@timed_query
+def should_dedupe(db: Session, location_id: int, metric: str, dedupe_minutes: int) -> bool:
+    cutoff = datetime.now(timezone.utc) - timedelta(minutes=dedupe_minutes)
+    row = latest_cache.get_alert(location_id)
+    if row is MISS:
+        row = db.execute(last_alert_stmt(location_id)).scalar_one_or_none()
+        if row is not None:
+            latest_cache.put_alerts([row])
+    return _is_dedupe(row, metric, cutoff)
+
+@timed_query
 def evaluate_and_generate_alerts(db: Session, tz_str: str = "America/Los_Angeles") -> list[Alert]:
-    fired: list[Alert] = []
-    tz = ZoneInfo(tz_str)
-    dedupe_min = settings.dedupe_minutes
-    for loc in db.query(Location).filter_by(active=True).all():
-        latest = latest_reading_for_location(db, loc.id)
-        if not latest:
-            continue
-        threshold = settings.default_threshold_pm25
-        obs = latest.pm25_ugm3
-        if obs is None:
-            continue
+    """
+    Evaluate every active location in one pass: two set-based reads (latest
+    readings, last alerts), decisions computed column-wise, one commit.
+    """
+    metric = "pm25"
+    settings = get_settings()
+    threshold = settings.default_threshold_pm25
+    now_utc = datetime.now(timezone.utc)
+    cutoff = now_utc - timedelta(minutes=settings.dedupe_minutes)
+    # quiet hours check in local time; identical for every location in this pass
+    quiet = within_quiet_hours(now_utc.astimezone(ZoneInfo(tz_str)), settings.quiet_start, settings.quiet_end)
+
+    locations = {loc.id: loc for loc in db.query(Location).filter_by(active=True).all()}
+    latest_by_loc = latest_readings_by_location(db)
+    last_alerts = last_alerts_by_location(db)
 
-        if obs >= threshold:
-            # quiet hours check in local time
-            now_local = datetime.now(tz)
-            from ..logic.normalize import within_quiet_hours
-            quiet = within_quiet_hours(now_local, settings.quiet_start, settings.quiet_end)
-            dedupe = should_dedupe(db, loc.id, "pm25", dedupe_min)
+    # Columns over locations that currently have an observation
+    loc_ids = [lid for lid, r in latest_by_loc.items() if lid in locations and r.pm25_ugm3 is not None]
+    observed = [float(latest_by_loc[lid].pm25_ugm3) for lid in loc_ids]
+    if settings.alert_pm25_basis == "nowcast":
+        rolled = rolling.values(db, loc_ids, now_utc)
+        observed = [rolled[lid].nowcast if lid in rolled and rolled[lid].nowcast is not None else obs
+                    for lid, obs in zip(loc_ids, observed)]
+    above = [obs >= threshold for obs in observed]
+    deduped = [_is_dedupe(last_alerts.get(lid), metric, cutoff) for lid in loc_ids]
 
-            status = "fired"
-            reason = None
-            if dedupe:
-                status, reason = "suppressed", "dedupe_window"
-            elif quiet:
-                status, reason = "suppressed", "quiet_hours"
+    alerts: list[Alert] = []
+    for lid, obs, is_above, is_dedupe in zip(loc_ids, observed, above, deduped):
+        if not is_above:
+            continue
+        status, reason = "fired", None
+        if is_dedupe:
+            status, reason = "suppressed", "dedupe_window"
+        elif quiet:
+            status, reason = "suppressed", "quiet_hours"
+        alerts.append(Alert(
+            location_id=lid,
+            metric=metric,
+            threshold_value=threshold,
+            observed_value=obs,
+            status=status,
+            reason=reason,
+            created_at=now_utc,
+        ))
 
-            alert = Alert(
-                location_id=loc.id,
-                metric="pm25",
-                threshold_value=threshold,
-                observed_value=float(obs),
-                status=status,
-                reason=reason
-            )
-            db.add(alert)
-            db.commit()
-            db.refresh(alert)
-            if status == "fired":
-                fired.append(alert)
-            logger.info(f"Alert {status} for {loc.name}: PM2.5={obs} threshold={threshold} reason={reason}")
-    return fired
+    if alerts:
+        db.add_all(alerts)
+        db.commit()
+        latest_cache.put_alerts(alerts)
+    for a in alerts:
+        alerts_total.inc(status=a.status, reason=a.reason or "none")
+        logger.info(f"Alert {a.status} for {locations[a.location_id].name}: "
+                    f"PM2.5={a.observed_value} threshold={threshold} reason={a.reason}")
+    return [a for a in alerts if a.status == "fired"]
@@ -0,0 +1,122 @@
+from __future__ import annotations
+import csv, os
+from datetime import date
+from typing import Iterator
+from sqlalchemy.orm import Session
+from sqlalchemy import select, and_
+
+from ..models import Location, DailyRollup
+
+EXPORT_COLUMNS = [
+    "date", "location", "readings",
+    "max_pm25_ugm3", "min_pm25_ugm3", "avg_pm25_ugm3", "last_pm25_ugm3",
+]
+SPLITS = ("none", "day", "month")
+FORMATS = ("csv", "parquet")
+
+def range_stats_stmt(start: date, end: date):
+    """Per-location daily stats for active locations over [start, end), ordered by day."""
+    return (
+        select(
+            DailyRollup.day,
+            Location.name,
+            DailyRollup.reading_count,
+            DailyRollup.pm25_max,
+            DailyRollup.pm25_min,
+            DailyRollup.pm25_sum / DailyRollup.reading_count,
+            DailyRollup.last_pm25,
+        )
+        .join(Location, DailyRollup.location_id == Location.id)
+        .where(and_(DailyRollup.day >= start, DailyRollup.day < end, Location.active.is_(True)))
+        .order_by(DailyRollup.day, Location.name)
+    )
+
+def iter_range_rows(db: Session, start: date, end: date, chunk: int = 1000) -> Iterator[tuple]:
+    """Stream rows with a server-side cursor; never materializes the full range."""
+    stmt = range_stats_stmt(start, end).execution_options(yield_per=chunk)
+    for day, name, n, mx, mn, avg, last in db.execute(stmt):
+        yield (day.isoformat(), name, int(n), float(mx), float(mn), float(avg), float(last))
+
+class _CsvSink:
+    def __init__(self, path: str):
+        self._f = open(path, "w", newline="")
+        self._w = csv.writer(self._f)
+        self._w.writerow(EXPORT_COLUMNS)
+
+    def write(self, row: tuple) -> None:
+        self._w.writerow(row)
+
+    def close(self) -> None:
+        self._f.close()
+
+class _ParquetSink:
+    """Buffers `batch_rows` rows, then appends them to the file as one row group."""
+    def __init__(self, path: str, batch_rows: int = 10_000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow") from e
+        self._pa = pa
+        self._schema = pa.schema([
+            ("date", pa.string()), ("location", pa.string()), ("readings", pa.int32()),
+            ("max_pm25_ugm3", pa.float64()), ("min_pm25_ugm3", pa.float64()),
+            ("avg_pm25_ugm3", pa.float64()), ("last_pm25_ugm3", pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+        self._batch_rows = batch_rows
+        self._buf: list[tuple] = []
+
+    def write(self, row: tuple) -> None:
+        self._buf.append(row)
+        if len(self._buf) >= self._batch_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._buf:
+            return
+        cols = list(zip(*self._buf))
+        self._writer.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(c, type=f.type) for c, f in zip(cols, self._schema)], schema=self._schema))
+        self._buf.clear()
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+def _split_key(day_iso: str, split: str, whole: str) -> str:
+    if split == "day":
+        return day_iso
+    if split == "month":
+        return day_iso[:7]
+    return whole
+
+def export_range(db: Session, start: date, end: date, out_dir: str = "reports",
+                 fmt: str = "csv", split: str = "none") -> list[str]:
+    """
+    Write per-location daily stats for [start, end) to CSV or Parquet, one
+    file for the whole range or one per day/month. Returns the paths written.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {FORMATS}")
+    if split not in SPLITS:
+        raise ValueError(f"split must be one of {SPLITS}")
+    os.makedirs(out_dir, exist_ok=True)
+    sink_cls = _CsvSink if fmt == "csv" else _ParquetSink
+    whole = f"{start.isoformat()}_{end.isoformat()}"
+    paths: list[str] = []
+    key, sink = None, None
+    try:
+        for row in iter_range_rows(db, start, end):
+            k = _split_key(row[0], split, whole)
+            if k != key:
+                if sink is not None:
+                    sink.close()
+                path = os.path.join(out_dir, f"{k}_summary.{fmt}")
+                sink, key = sink_cls(path), k
+                paths.append(path)
+            sink.write(row)
+    finally:
+        if sink is not None:
+            sink.close()
+    return paths
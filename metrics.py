@@ -0,0 +1,176 @@
+from __future__ import annotations
+import bisect
+import cProfile
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from loguru import logger
+
+from .config import get_settings
+
+# Seconds; covers fast cache hits through multi-minute ingest cycles
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+def _fmt_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(key)} {v}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.help, self.buckets = name, help, tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)  # first bucket with le >= value
+            if i < len(self.buckets):
+                s[i] += 1
+            s[-2] += value
+            s[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def expose(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, s in sorted(self._series.items()):
+                cum = 0
+                for le, n in zip(self.buckets, s):
+                    cum += n
+                    lines.append(f"{self.name}_bucket{_fmt_labels(key + (('le', str(le)),))} {cum}")
+                lines.append(f"{self.name}_bucket{_fmt_labels(key + (('le', '+Inf'),))} {s[-1]}")
+                lines.append(f"{self.name}_sum{_fmt_labels(key)} {s[-2]}")
+                lines.append(f"{self.name}_count{_fmt_labels(key)} {s[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help))
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, buckets))
+
+    def expose(self) -> str:
+        lines: list[str] = []
+        for m in self._metrics.values():
+            lines.extend(m.expose())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+provider_request_seconds = registry.histogram("aqi_provider_request_seconds", "Upstream provider request latency")
+provider_requests = registry.counter("aqi_provider_requests_total", "Upstream provider requests by outcome")
+provider_retries = registry.counter("aqi_provider_retries_total", "Provider request retries scheduled by tenacity")
+readings_written = registry.counter("aqi_readings_total", "Readings handled by ingest, by result (inserted|duplicate)")
+db_query_seconds = registry.histogram("aqi_db_query_seconds", "Time spent in reporter/evaluator DB functions")
+alerts_total = registry.counter("aqi_alerts_total", "Alerts by status and suppression reason")
+smtp_send_seconds = registry.histogram("aqi_smtp_send_seconds", "SMTP send latency per message")
+smtp_sends = registry.counter("aqi_smtp_sends_total", "SMTP sends by outcome")
+job_seconds = registry.histogram("aqi_job_seconds", "Scheduler job run time")
+job_runs = registry.counter("aqi_job_runs_total", "Scheduler job runs by outcome")
+api_requests = registry.counter("aqi_api_requests_total", "HTTP API requests by route and status")
+api_request_seconds = registry.histogram("aqi_api_request_seconds", "HTTP API request latency by route")
+shard_lease_events = registry.counter("aqi_shard_lease_events_total", "Worker shard leases by event (claim|takeover|lost|release)")
+
+def timed_query(fn):
+    """Decorator: record a DB-facing function's wall time under aqi_db_query_seconds{function=...}."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with db_query_seconds.time(function=fn.__name__):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def count_retry(provider: str):
+    """tenacity `before_sleep` hook counting retries per provider."""
+    def before_sleep(retry_state) -> None:
+        provider_retries.inc(provider=provider)
+    return before_sleep
+
+def instrument_job(name: str, fn):
+    """
+    Wrap a scheduler job: time it, count outcomes, and when PROFILE_DIR is set
+    dump a cProfile .prof file per run.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile_dir = get_settings().profile_dir
+        prof = cProfile.Profile() if profile_dir else None
+        t0 = time.perf_counter()
+        outcome = "ok"
+        try:
+            if prof is not None:
+                return prof.runcall(fn, *args, **kwargs)
+            return fn(*args, **kwargs)
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            job_seconds.observe(time.perf_counter() - t0, job=name)
+            job_runs.inc(job=name, outcome=outcome)
+            if prof is not None:
+                os.makedirs(profile_dir, exist_ok=True)
+                path = os.path.join(profile_dir, f"{name}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.prof")
+                prof.dump_stats(path)
+                logger.info(f"Profile for {name} written to {path}")
+    return wrapper
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = registry.expose().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve Prometheus text format on http://host:port/metrics from a daemon thread."""
+    srv = ThreadingHTTPServer((host, port), _MetricsHandler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Metrics on http://{host}:{port}/metrics")
+    return srv
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, Float, Boolean, ForeignKey, DateTime, UniqueConstraint, JSON
-from datetime import datetime, timezone
+from sqlalchemy import String, Integer, Float, Boolean, ForeignKey, DateTime, Date, UniqueConstraint, Index, JSON, LargeBinary
+from datetime import datetime, date, timezone
 
 from .db import Base
 
@@ -26,7 +26,33 @@ class Reading(Base):
     raw_payload: Mapped[dict | None] = mapped_column(JSON, nullable=True)
     ingested_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
     location: Mapped["Location"] = relationship(back_populates="readings")
-    __table_args__ = (UniqueConstraint("location_id", "observed_at", "provider", name="uq_reading_unique"),)
+    __table_args__ = (
+        # Its (location_id, observed_at) prefix also serves latest-per-location
+        # (ORDER BY observed_at DESC) and per-day range scans; no separate index needed
+        UniqueConstraint("location_id", "observed_at", "provider", name="uq_reading_unique"),
+    )
+
+class DailyRollup(Base):
+    """Per-location UTC-day PM2.5 aggregates, maintained incrementally at ingest."""
+    __tablename__ = "daily_rollups"
+    location_id: Mapped[int] = mapped_column(ForeignKey("locations.id"), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # UTC day
+    reading_count: Mapped[int] = mapped_column(Integer)
+    pm25_sum: Mapped[float] = mapped_column(Float)
+    pm25_max: Mapped[float] = mapped_column(Float)
+    pm25_min: Mapped[float] = mapped_column(Float)
+    last_observed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))  # UTC
+    last_pm25: Mapped[float] = mapped_column(Float)
+    __table_args__ = (Index("ix_daily_rollups_day", "day"),)  # date-range exports
+
+class RollingState(Base):
+    """Per-location 24h PM2.5 ring buffer (rolling.py), written with each ingest so restarts don't rescan readings."""
+    __tablename__ = "rolling_state"
+    location_id: Mapped[int] = mapped_column(ForeignKey("locations.id"), primary_key=True)
+    head_hour: Mapped[int] = mapped_column(Integer)  # hours since the epoch of the newest slot
+    sums: Mapped[bytes] = mapped_column(LargeBinary)  # array('d') per-hour PM2.5 sums
+    counts: Mapped[bytes] = mapped_column(LargeBinary)  # array('i') per-hour reading counts
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
 
 class Alert(Base):
     __tablename__ = "alerts"
@@ -38,3 +64,48 @@ class Alert(Base):
     status: Mapped[str] = mapped_column(String(20))  # 'fired'|'suppressed'
     reason: Mapped[str | None] = mapped_column(String(50), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    __table_args__ = (Index("ix_alerts_location_created", "location_id", "created_at"),)
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    alert_id: Mapped[int] = mapped_column(ForeignKey("alerts.id"))
+    recipient: Mapped[str] = mapped_column(String)
+    status: Mapped[str] = mapped_column(String(20), default="pending")  # 'pending'|'sending'|'sent'|'dead'
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc))
+    sent_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    alert: Mapped["Alert"] = relationship()
+    __table_args__ = (Index("ix_outbox_status_next_attempt", "status", "next_attempt_at"),)
+
+class AirNowArea(Base):
+    """AirNow reporting area a location's own query resolves to; lets locations in one area share a query."""
+    __tablename__ = "airnow_areas"
+    location_id: Mapped[int] = mapped_column(ForeignKey("locations.id"), primary_key=True)
+    lat: Mapped[float] = mapped_column(Float)  # location point when learned; a moved location relearns
+    lon: Mapped[float] = mapped_column(Float)
+    area_lat: Mapped[float] = mapped_column(Float)
+    area_lon: Mapped[float] = mapped_column(Float)
+    learned_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    cluster_failed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+class ShardLease(Base):
+    """One row per ingest shard (locations with id % shard_count == shard); see shards.py."""
+    __tablename__ = "shard_leases"
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    shard_count: Mapped[int] = mapped_column(Integer)
+    owner: Mapped[str | None] = mapped_column(String, nullable=True)  # worker id; None = free
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    heartbeat_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_run_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)  # survives takeover
+    generation: Mapped[int] = mapped_column(Integer, default=0)  # bumped on every change of owner
+
+class WorkerHeartbeat(Base):
+    """Presence of a `cli worker` process, renewed by its heartbeat; the fleet size for shard fair shares."""
+    __tablename__ = "worker_heartbeats"
+    worker_id: Mapped[str] = mapped_column(String, primary_key=True)
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
@@ -0,0 +1,91 @@
+from __future__ import annotations
+import httpx
+from datetime import datetime, timezone
+from tenacity import retry, wait_exponential_jitter, stop_after_attempt
+from loguru import logger
+from typing import List
+
+from ..config import get_settings
+from ..metrics import count_retry
+from .base_provider import BaseProvider, ReadingDTO
+from .response_cache import response_cache, observation_expiry
+
+SEARCH_RADIUS_METERS = 25_000
+
+class OpenAQProvider(BaseProvider):
+    """
+    OpenAQ-style `latest` endpoint: stations within a radius, each with its
+    most recent measurements. OPENAQ_BASE_URL can point at a local fixture server.
+    """
+    name = "openaq"
+    async_mode = True
+
+    @property
+    def endpoint(self) -> str:
+        return get_settings().openaq_base_url.rstrip("/") + "/v2/latest"
+
+    def _params(self, lat: float, lon: float) -> dict:
+        return {
+            "coordinates": f"{lat:.4f},{lon:.4f}",
+            "radius": str(SEARCH_RADIUS_METERS),
+            "parameter": "pm25",
+            "limit": "100",
+        }
+
+    def _headers(self) -> dict:
+        key = get_settings().openaq_api_key
+        return {"X-API-Key": key} if key else {}
+
+    def _parse(self, data: dict) -> List[ReadingDTO]:
+        out: List[ReadingDTO] = []
+        construct = ReadingDTO.model_construct
+        for station in data.get("results", []):
+            coords = station.get("coordinates") or {}
+            for m in station.get("measurements", []):
+                if m.get("parameter") != "pm25" or m.get("value") is None or m.get("value") < 0:
+                    continue
+                ts = datetime.fromisoformat(m["lastUpdated"].replace("Z", "+00:00")).astimezone(timezone.utc)
+                out.append(construct(
+                    # providers report on different minute marks; align to the hour like AirNow
+                    observed_at=ts.replace(minute=0, second=0, microsecond=0),
+                    pm25_ugm3=float(m["value"]),
+                    aqi=None,
+                    provider=self.name,
+                    station_lat=coords.get("latitude"),
+                    station_lon=coords.get("longitude"),
+                ))
+        return out
+
+    @retry(wait=wait_exponential_jitter(1, 8), stop=stop_after_attempt(3), before_sleep=count_retry("openaq"))
+    def _get(self, params: dict) -> dict:
+        r = httpx.get(self.endpoint, params=params, headers=self._headers(), timeout=get_settings().http_timeout_seconds)
+        r.raise_for_status()
+        return r.json()
+
+    @retry(wait=wait_exponential_jitter(1, 8), stop=stop_after_attempt(3), before_sleep=count_retry("openaq"))
+    async def _aget(self, client: httpx.AsyncClient, params: dict) -> dict:
+        r = await client.get(self.endpoint, params=params, headers=self._headers())
+        r.raise_for_status()
+        return r.json()
+
+    def fetch_by_location(self, lat: float, lon: float) -> List[ReadingDTO]:
+        params = self._params(lat, lon)
+        key = response_cache.key(self.endpoint, params)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+        out = self._parse(self._get(params))
+        response_cache.put(key, out, observation_expiry())
+        logger.info(f"OpenAQ: {len(out)} PM2.5 rows for lat={lat} lon={lon}")
+        return out
+
+    async def afetch_by_location(self, client: httpx.AsyncClient, lat: float, lon: float) -> List[ReadingDTO]:
+        params = self._params(lat, lon)
+        key = response_cache.key(self.endpoint, params)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+        out = self._parse(await self._aget(client, params))
+        response_cache.put(key, out, observation_expiry())
+        logger.info(f"OpenAQ: {len(out)} PM2.5 rows for lat={lat} lon={lon}")
+        return out
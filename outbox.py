@@ -0,0 +1,130 @@
+from __future__ import annotations
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import and_, select, update
+from loguru import logger
+
+from ..models import Alert, Location, NotificationOutbox
+from ..config import get_settings
+from .email_notifier import EmailNotifier, build_message
+
+def _to_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+def enqueue_alerts(db: Session, alerts: list[Alert], recipients: list[str]) -> int:
+    """Queue one outbox row per (alert, recipient) in a single transaction."""
+    rows = [NotificationOutbox(alert_id=a.id, recipient=rcpt) for a in alerts for rcpt in recipients]
+    if rows:
+        db.add_all(rows)
+        db.commit()
+    return len(rows)
+
+def _render(alerts: list[tuple[Alert, str]]) -> tuple[str, str]:
+    if len(alerts) == 1:
+        a, name = alerts[0]
+        subject = f"[AQI Alert] {name}: PM2.5 {a.observed_value:.1f} µg/m³ ≥ {a.threshold_value:.0f}"
+    else:
+        subject = f"[AQI Alert] {len(alerts)} locations at or above PM2.5 threshold"
+    lines = []
+    for a, name in sorted(alerts, key=lambda x: x[0].observed_value, reverse=True):
+        lines.append(
+            f"{name}: PM2.5 {a.observed_value:.1f} µg/m³ (threshold {a.threshold_value:.0f}) "
+            f"at {_to_utc(a.created_at).isoformat()}"
+        )
+    lines.append("")
+    lines.append("Provider: AirNow")
+    return subject, "\n".join(lines)
+
+# How long a drain owns the rows it claimed; a drain that dies mid-send releases them after this
+CLAIM_SECONDS = 600
+
+def _due(now: datetime):
+    """Pending rows that are due, plus claims abandoned by a drain that died."""
+    return and_(NotificationOutbox.status.in_(("pending", "sending")), NotificationOutbox.next_attempt_at <= now)
+
+def _claim(db: Session, rows: list[NotificationOutbox], now: datetime) -> list[NotificationOutbox]:
+    """
+    Mark rows 'sending' with a conditional UPDATE and return the ones this
+    drain won, so a concurrent drain (drain-outbox-now beside the scheduler)
+    can't send them too: whichever commits second no longer matches _due().
+    """
+    until = now + timedelta(seconds=CLAIM_SECONDS)
+    won = set(db.execute(
+        update(NotificationOutbox)
+        .where(NotificationOutbox.id.in_([r.id for r in rows]), _due(now))
+        .values(status="sending", next_attempt_at=until)
+        .returning(NotificationOutbox.id)
+        .execution_options(synchronize_session=False)
+    ).scalars())
+    db.commit()
+    claimed = [r for r in rows if r.id in won]
+    for r in claimed:  # keep the loaded objects in step, so the outcome's UPDATE writes status
+        set_committed_value(r, "status", "sending")
+        set_committed_value(r, "next_attempt_at", until)
+    return claimed
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(get_settings().notify_retry_base_seconds * 2 ** (attempts - 1), 6 * 3600))
+
+def drain_outbox(db: Session, notifier: EmailNotifier | None = None, flush: bool = False) -> int:
+    """
+    Send due outbox rows, one coalesced message per recipient, over a single
+    SMTP session. A recipient's rows wait until the oldest has been pending
+    for NOTIFY_COALESCE_SECONDS (unless `flush`) so a burst becomes one email.
+    Each recipient's rows are claimed before sending, so concurrent drains
+    never send the same row twice. Failures are retried with exponential
+    backoff, then marked 'dead'. Returns the number of messages sent.
+    """
+    now = datetime.now(timezone.utc)
+    due = db.execute(
+        select(NotificationOutbox)
+        .options(joinedload(NotificationOutbox.alert))
+        .where(_due(now))
+        .order_by(NotificationOutbox.id)
+    ).scalars().all()
+    if not due:
+        return 0
+
+    names = {loc.id: loc.name for loc in db.query(Location).all()}
+    by_recipient: dict[str, list[NotificationOutbox]] = defaultdict(list)
+    for row in due:
+        by_recipient[row.recipient].append(row)
+
+    settings = get_settings()
+    window = timedelta(seconds=settings.notify_coalesce_seconds)
+    notifier = notifier or EmailNotifier()
+    sent = 0
+    conn = notifier.connection()
+    try:
+        for rcpt, rows in by_recipient.items():
+            oldest = min(_to_utc(r.created_at) for r in rows)
+            if not flush and now - oldest < window:
+                continue  # still collecting this recipient's burst
+            rows = _claim(db, rows, now)
+            if not rows:
+                continue  # another drain got there first
+            subject, body = _render([(r.alert, names.get(r.alert.location_id, "?")) for r in rows])
+            try:
+                if settings.email_enabled:
+                    conn.sendmail([rcpt], build_message(subject, body, [rcpt]))
+            except Exception as e:
+                conn.close()
+                for r in rows:
+                    r.attempts += 1
+                    r.last_error = repr(e)[:500]
+                    if r.attempts >= settings.notify_max_attempts:
+                        r.status = "dead"
+                    else:
+                        r.status, r.next_attempt_at = "pending", now + _backoff(r.attempts)
+                logger.warning(f"Outbox: send to {rcpt} failed (attempt {rows[0].attempts}): {e!r}")
+            else:
+                for r in rows:
+                    r.status, r.sent_at = "sent", now
+                sent += 1
+                logger.info(f"Outbox: sent {len(rows)} alert(s) to {rcpt}")
+            db.commit()
+    finally:
+        conn.close()
+    return sent
@@ -0,0 +1,27 @@
+from __future__ import annotations
+from .base_provider import BaseProvider
+from .airnow_provider import AirNowProvider
+from .openaq_provider import OpenAQProvider
+from ..config import get_settings
+
+PROVIDERS: dict[str, type[BaseProvider]] = {
+    AirNowProvider.name: AirNowProvider,
+    OpenAQProvider.name: OpenAQProvider,
+}
+
+def register_provider(cls: type[BaseProvider]) -> type[BaseProvider]:
+    """Class decorator for out-of-tree providers: @register_provider class MyProvider(BaseProvider): ..."""
+    PROVIDERS[cls.name] = cls
+    return cls
+
+def get_providers(names: str | None = None) -> list[BaseProvider]:
+    """Instantiate providers from a comma-separated list (defaults to PROVIDER)."""
+    out: list[BaseProvider] = []
+    for name in (names or get_settings().provider).split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown provider {name!r}; known: {sorted(PROVIDERS)}")
+        out.append(PROVIDERS[name]())
+    return out
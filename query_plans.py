@@ -0,0 +1,45 @@
+from __future__ import annotations
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+
+from .logic.reporter import latest_readings_stmt, daily_stats_stmt
+from .logic.evaluator import latest_reading_stmt, last_alert_stmt, last_alerts_stmt
+
+# Tables that grow with history; a plain SCAN of these means a missing/unused index.
+# `locations` is small and driving it with SCAN is expected.
+GROWING_TABLES = ("readings", "alerts", "daily_rollups")
+
+def hot_queries() -> dict[str, object]:
+    return {
+        "latest_readings": latest_readings_stmt(),
+        "daily_stats": daily_stats_stmt(datetime.now(timezone.utc).date()),
+        "latest_reading_for_location": latest_reading_stmt(1),
+        "last_alert": last_alert_stmt(1),
+        "last_alerts": last_alerts_stmt(),
+    }
+
+def explain(db: Session, stmt) -> list[str]:
+    """EXPLAIN QUERY PLAN detail lines for a statement (SQLite only)."""
+    conn = db.connection()
+    compiled = stmt.compile(dialect=conn.dialect)
+    params = compiled.construct_params()
+    args = tuple(params[name] for name in (compiled.positiontup or ()))
+    return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled.string}", args)]
+
+def full_table_scans(db: Session) -> dict[str, list[str]]:
+    """
+    Map of hot-query name -> offending plan lines for every hot query that
+    falls back to a full scan of a growing table. Empty dict means all good.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        raise NotImplementedError("query plan check only supports SQLite")
+    bad: dict[str, list[str]] = {}
+    for name, stmt in hot_queries().items():
+        lines = [
+            line for line in explain(db, stmt)
+            # aliases render as e.g. readings_1
+            if line.startswith("SCAN") and line.split()[1].rstrip("_0123456789") in GROWING_TABLES
+        ]
+        if lines:
+            bad[name] = lines
+    return bad
@@ -1,28 +1,88 @@
 from __future__ import annotations
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, and_, desc
-from datetime import datetime, timezone, timedelta
+from sqlalchemy import select, and_, desc
+from datetime import date, datetime, timezone, timedelta
 import csv, os
 from zoneinfo import ZoneInfo
-from ..models import Reading, Location
+from ..models import Reading, Location, DailyRollup
+from ..cache import latest_cache, LatestReading, MISS
+from ..metrics import timed_query
+from ..rolling import rolling
+from .digest_template import render_digest
 
 
-def daily_summary(db: Session, date_utc: datetime):
-    start = datetime(date_utc.year, date_utc.month, date_utc.day, tzinfo=timezone.utc)
-    end = start + timedelta(days=1)
-    rows = []
-    for loc in db.query(Location).filter_by(active=True).all():
-        q = (
-            db.query(
-                func.max(Reading.pm25_ugm3),
-                func.avg(Reading.pm25_ugm3)
-            )
-            .filter(and_(Reading.location_id == loc.id, Reading.observed_at >= start, Reading.observed_at < end))
-            .one_or_none()
+def latest_readings_stmt(location_ids: list[int] | None = None):
+    """
+    Latest reading per active location in one query. The correlated
+    ORDER BY observed_at DESC LIMIT 1 lookup is an index seek per location,
+    so cost grows with the number of locations, not with history length.
+    """
+    latest_id = (
+        select(Reading.id)
+        .where(Reading.location_id == Location.id)
+        .order_by(desc(Reading.observed_at))
+        .limit(1)
+        .correlate(Location)
+        .scalar_subquery()
+    )
+    stmt = (
+        select(Reading)
+        .join(Location, Reading.location_id == Location.id)
+        .where(Location.active.is_(True), Reading.id == latest_id)
+    )
+    if location_ids is not None:
+        stmt = stmt.where(Location.id.in_(location_ids))
+    return stmt
+
+@timed_query
+def latest_readings_by_location(db: Session, location_ids: list[int] | None = None) -> dict[int, LatestReading]:
+    """Served from the process-local cache when it is warm; only misses go to the database."""
+    if location_ids is None:
+        cached = latest_cache.all_readings()
+        if cached is not None:
+            return cached
+        rows = db.execute(latest_readings_stmt()).scalars().all()
+        latest_cache.load_readings(rows)
+        return {r.location_id: LatestReading.of(r) for r in rows}
+
+    out: dict[int, LatestReading] = {}
+    missing: list[int] = []
+    for lid in location_ids:
+        hit = latest_cache.get_reading(lid)
+        if hit is MISS:
+            missing.append(lid)
+        elif hit is not None:
+            out[lid] = hit
+    if missing:
+        rows = db.execute(latest_readings_stmt(missing)).scalars().all()
+        latest_cache.put_readings(rows)
+        out.update((r.location_id, LatestReading.of(r)) for r in rows)
+    return out
+
+def daily_stats_stmt(day: date):
+    """
+    (location_id, name, max, avg) for every active location on a UTC day, read
+    from daily_rollups (one primary-key lookup per location); NULLs when no data.
+    """
+    return (
+        select(
+            Location.id,
+            Location.name,
+            DailyRollup.pm25_max,
+            DailyRollup.pm25_sum / DailyRollup.reading_count,
         )
-        if q:
-            rows.append((loc.name, float(q[0] or 0), float(q[1] or 0)))
-    return rows
+        .select_from(Location)
+        .outerjoin(DailyRollup, and_(DailyRollup.location_id == Location.id, DailyRollup.day == day))
+        .where(Location.active.is_(True))
+        .order_by(Location.id)
+    )
+
+@timed_query
+def daily_summary(db: Session, date_utc: datetime):
+    return [
+        (name, float(mx or 0), float(avg or 0))
+        for _, name, mx, avg in db.execute(daily_stats_stmt(date_utc.date()))
+    ]
 
 def write_csv(path: str, rows: list[tuple[str, float, float]]):
     os.makedirs(os.path.dirname(path), exist_ok=True)
@@ -32,13 +92,8 @@ def write_csv(path: str, rows: list[tuple[str, float, float]]):
         for r in rows:
             w.writerow(r)
 
-def latest_reading(db: Session, location_id: int) -> Reading | None:
-    return db.execute(
-        select(Reading)
-        .where(Reading.location_id == location_id)
-        .order_by(desc(Reading.observed_at))
-        .limit(1)
-    ).scalar_one_or_none()
+def latest_reading(db: Session, location_id: int) -> LatestReading | None:
+    return latest_readings_by_location(db, [location_id]).get(location_id)
 
 def pm25_category(pm25: float) -> tuple[str, str]:
     """
@@ -52,15 +107,21 @@ def pm25_category(pm25: float) -> tuple[str, str]:
     if pm25 <= 250.4:            return ("Very Unhealthy", "🟣")
     return ("Hazardous", "🟤")
 
+@timed_query
 def build_morning_digest_rows(db: Session, threshold: float) -> list[dict]:
     ysum = yesterday_summary(db)
+    latest = latest_readings_by_location(db)
+    rolled = rolling.values(db)
     rows = []
     for loc in db.query(Location).filter_by(active=True).all():
-        last = latest_reading(db, loc.id)
+        last = latest.get(loc.id)
         if not last or last.pm25_ugm3 is None:
             continue
         pm = float(last.pm25_ugm3)
-        cat, badge = pm25_category(pm)
+        rv = rolled.get(loc.id)
+        nowcast = rv.nowcast if rv else None
+        # EPA bands are defined for averaged exposure; NowCast is the hourly proxy, the raw value a fallback
+        cat, badge = pm25_category(nowcast if nowcast is not None else pm)
         delta = pm - threshold
         ys = ysum.get(loc.name, {})
         rows.append({
@@ -69,6 +130,8 @@ def build_morning_digest_rows(db: Session, threshold: float) -> list[dict]:
             "category_now": cat,
             "badge": badge,
             "delta_now": delta,
+            "pm25_nowcast": nowcast,
+            "pm25_24h": rv.avg24 if rv else None,
             "y_max": ys.get("max_pm25"),
             "y_avg": ys.get("avg_pm25"),
         })
@@ -77,109 +140,16 @@ def build_morning_digest_rows(db: Session, threshold: float) -> list[dict]:
 
 
 def render_digest_html(rows: list[dict], threshold: float, tz_str: str = "America/Los_Angeles") -> str:
-    now_local = datetime.now(ZoneInfo(tz_str))
-    header = f"""
-    <html><body>
-    <h2 style="font-family:system-ui;margin-bottom:4px;">Daily Air Quality Digest</h2>
-    <div style="color:#555;font-family:system-ui;margin-bottom:14px;">
-      {now_local:%A, %B %d, %Y • %I:%M %p %Z}
-      &nbsp;|&nbsp; Threshold: {threshold:.0f} µg/m³ (PM2.5)
-    </div>
-    <table cellpadding="8" cellspacing="0" border="0" style="border-collapse:collapse;font-family:system-ui;font-size:14px;">
-      <thead>
-        <tr style="background:#f1f3f5;">
-          <th align="left">City</th>
-          <th align="right">Now PM2.5</th>
-          <th align="left">Now Category</th>
-          <th align="right">Δ vs Thresh</th>
-          <th align="right">Yday Max</th>
-          <th align="right">Yday Avg</th>
-          <th align="left">Status</th>
-        </tr>
-      </thead>
-      <tbody>
-    """
-    def fmt_val(v):
-        return f"{v:.1f}" if v is not None else "—"
-    def fmt_delta(d):
-        if d is None: return "—"
-        sign = "+" if d >= 0 else "–"; mag = abs(d)
-        color = "#c92a2a" if d >= 0 else "#2b8a3e"
-        return f"<span style='color:{color};font-variant-numeric:tabular-nums;'>{sign}{mag:.1f}</span>"
-
-    body = []
-    for r in rows:
-        status = "Above" if r["delta_now"] is not None and r["delta_now"] >= 0 else "Below"
-        color = "#c92a2a" if status == "Above" else "#2b8a3e"
-        body.append(f"""
-          <tr style="border-bottom:1px solid #eee;">
-            <td>{r['city']}</td>
-            <td align="right" style="font-variant-numeric:tabular-nums;">{fmt_val(r['pm25_now'])}</td>
-            <td>{r['badge']} {r['category_now']}</td>
-            <td align="right">{fmt_delta(r['delta_now'])}</td>
-            <td align="right" style="font-variant-numeric:tabular-nums;">{fmt_val(r['y_max'])}</td>
-            <td align="right" style="font-variant-numeric:tabular-nums;">{fmt_val(r['y_avg'])}</td>
-            <td style="color:{color};">{status}</td>
-          </tr>
-        """)
-    tail = """
-      </tbody>
-    </table>
-    <div style="color:#666;font-size:12px;margin-top:10px;font-family:system-ui;">
-      Source: AirNow. “Now” uses most recently ingested PM2.5; “Yday” aggregates cover the previous UTC day.
-    </div>
-    </body></html>
-    """
-    return header + "\n".join(body) + tail
-
-    def fmt_delta(d: float) -> str:
-        sign = "+" if d >= 0 else "–"
-        mag = abs(d)
-        color = "#c92a2a" if d >= 0 else "#2b8a3e"
-        return f"<span style='color:{color};font-variant-numeric:tabular-nums;'>{sign}{mag:.1f}</span>"
-
-    body_rows = []
-    for r in rows:
-        status = "Above" if r["delta"] >= 0 else "Below"
-        color = "#c92a2a" if status == "Above" else "#2b8a3e"
-        body_rows.append(f"""
-          <tr style="border-bottom:1px solid #eee;">
-            <td>{r['city']}</td>
-            <td align="right" style="font-variant-numeric:tabular-nums;">{r['pm25']:.1f}</td>
-            <td>{r['badge']} {r['category']}</td>
-            <td align="right">{fmt_delta(r['delta'])}</td>
-            <td style="color:{color};">{status}</td>
-          </tr>
-        """)
-    tail = """
-      </tbody>
-    </table>
-    <div style="color:#666;font-size:12px;margin-top:10px;font-family:system-ui;">
-      Source: AirNow. PM2.5 shown; categories approximate EPA bands.
-    </div>
-    </body></html>
-    """
-    return header + "\n".join(body_rows) + tail
+    return render_digest(rows, threshold, datetime.now(ZoneInfo(tz_str)))
 
+@timed_query
 def yesterday_summary(db: Session) -> dict[str, dict]:
     # UTC day boundary; digest renders with local tz separately
-    today_utc = datetime.now(timezone.utc).date()
-    start = datetime(today_utc.year, today_utc.month, today_utc.day, tzinfo=timezone.utc) - timedelta(days=1)
-    end = start + timedelta(days=1)
-
+    yesterday = datetime.now(timezone.utc).date() - timedelta(days=1)
     out: dict[str, dict] = {}
-    for loc in db.query(Location).filter_by(active=True).all():
-        q = (
-            db.query(
-                func.max(Reading.pm25_ugm3),
-                func.avg(Reading.pm25_ugm3)
-            )
-            .filter(and_(Reading.location_id == loc.id,
-                         Reading.observed_at >= start,
-                         Reading.observed_at < end))
-            .one_or_none()
-        )
-        max_pm = float(q[0]) if q and q[0] is not None else None
-        avg_pm = float(q[1]) if q and q[1] is not None else None
-        out[loc.name] = {"max_pm25": max_pm, "avg_pm25": avg_pm}
+    for _, name, mx, avg in db.execute(daily_stats_stmt(yesterday)):
+        out[name] = {
+            "max_pm25": float(mx) if mx is not None else None,
+            "avg_pm25": float(avg) if avg is not None else None,
+        }
     return out
@@ -0,0 +1,121 @@
+from __future__ import annotations
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from loguru import logger
+
+from ..config import get_settings
+from .base_provider import ReadingDTO
+
+def observation_expiry(now: datetime | None = None) -> float:
+    """
+    Epoch seconds when a response fetched `now` goes stale: the next point at
+    which the provider has had the grace period to publish a new hour. A fetch
+    at 10:05 with 10 minutes' grace expires at 10:10, one at 10:15 at 11:10.
+    """
+    now = now or datetime.now(timezone.utc)
+    t = now.replace(minute=0, second=0, microsecond=0) + timedelta(minutes=get_settings().provider_cache_grace_minutes)
+    if t <= now:
+        t += timedelta(hours=1)
+    return t.timestamp()
+
+class ResponseCache:
+    """
+    LRU of parsed provider responses keyed by request parameters, with an
+    optional SQLite file behind it so restarts don't refetch unchanged data.
+    A max_entries of 0 disables caching; None for either argument means
+    PROVIDER_CACHE_SIZE / PROVIDER_CACHE_PATH, read on first use.
+    """
+    def __init__(self, max_entries: int | None = None, path: str | None = None):
+        self._max_entries = max_entries
+        self._path = path
+        self._mem: OrderedDict[str, tuple[float, list[ReadingDTO]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: sqlite3.Connection | None = None
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is None:
+            self._max_entries = get_settings().provider_cache_size
+        return self._max_entries
+
+    @max_entries.setter
+    def max_entries(self, value: int) -> None:
+        self._max_entries = value
+
+    @property
+    def path(self) -> str | None:
+        if self._path is None:
+            self._path = get_settings().provider_cache_path or ""
+        return self._path or None
+
+    @staticmethod
+    def key(endpoint: str, params: dict) -> str:
+        # API keys don't change the answer and shouldn't be written to disk
+        return endpoint + "?" + json.dumps({k: v for k, v in params.items() if k != "API_KEY"}, sort_keys=True)
+
+    def _db(self) -> sqlite3.Connection | None:
+        if not self.path:
+            return None
+        if self._disk is None:
+            self._disk = sqlite3.connect(self.path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, expires_at REAL, payload TEXT)"
+            )
+            self._disk.execute("DELETE FROM response_cache WHERE expires_at < ?", (time.time(),))
+            self._disk.commit()
+        return self._disk
+
+    def get(self, key: str) -> list[ReadingDTO] | None:
+        if self.max_entries <= 0:
+            return None
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                if hit[0] > now:
+                    self._mem.move_to_end(key)
+                    return hit[1]
+                del self._mem[key]
+            db = self._db()
+            if db is None:
+                return None
+            row = db.execute(
+                "SELECT expires_at, payload FROM response_cache WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            dtos = [ReadingDTO.model_validate(d) for d in json.loads(row[1])]
+            self._put_mem(key, row[0], dtos)
+            return dtos
+
+    def put(self, key: str, dtos: list[ReadingDTO], expires_at: float) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._put_mem(key, expires_at, dtos)
+            db = self._db()
+            if db is not None:
+                payload = json.dumps([d.model_dump(mode="json") for d in dtos])
+                db.execute("INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?)", (key, expires_at, payload))
+                db.commit()
+
+    def _put_mem(self, key: str, expires_at: float, dtos: list[ReadingDTO]) -> None:
+        self._mem[key] = (expires_at, dtos)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            db = self._db()
+            if db is not None:
+                db.execute("DELETE FROM response_cache")
+                db.commit()
+        logger.info("Provider response cache cleared")
+
+response_cache = ResponseCache()
@@ -0,0 +1,196 @@
+from __future__ import annotations
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, NamedTuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from .config import get_settings
+from .models import Location, Reading, RollingState
+from .store import _insert_for
+
+WINDOW_HOURS = 24
+NOWCAST_HOURS = 12
+MAX_LAG_HOURS = 2    # newest data this many hours old still anchors the window (providers publish late)
+MIN_24H_HOURS = 18   # EPA 75% completeness for a 24h average
+
+def _hour(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)  # SQLite hands back naive UTC
+    return int(dt.timestamp() // 3600)
+
+class RollingValues(NamedTuple):
+    nowcast: float | None  # EPA PM2.5 NowCast, µg/m³
+    avg24: float | None    # mean of hourly means over the last 24h
+
+class PM25Window:
+    """
+    Fixed 24-slot ring of per-hour PM2.5 sums/counts for one location, slot =
+    hour % 24. add() touches one slot (plus at most 24 cleared when the window
+    moves forward); nowcast()/avg24() read a constant number of slots.
+    """
+    __slots__ = ("head", "sums", "counts")
+
+    def __init__(self, head: int | None = None, sums: array | None = None, counts: array | None = None):
+        self.head = head  # hour (since the epoch) of the newest slot; None = empty
+        self.sums = sums if sums is not None else array("d", [0.0]) * WINDOW_HOURS
+        self.counts = counts if counts is not None else array("i", [0]) * WINDOW_HOURS
+
+    def add(self, hour: int, value: float) -> bool:
+        """Fold one reading in; False if it's older than the window."""
+        if self.head is None or hour > self.head:
+            first = hour - WINDOW_HOURS + 1 if self.head is None else max(self.head + 1, hour - WINDOW_HOURS + 1)
+            for h in range(first, hour + 1):
+                self.sums[h % WINDOW_HOURS] = 0.0
+                self.counts[h % WINDOW_HOURS] = 0
+            self.head = hour
+        elif hour <= self.head - WINDOW_HOURS:
+            return False
+        i = hour % WINDOW_HOURS
+        self.sums[i] += value
+        self.counts[i] += 1
+        return True
+
+    def hourly(self, hour: int) -> float | None:
+        if self.head is None or hour > self.head or hour <= self.head - WINDOW_HOURS:
+            return None
+        n = self.counts[hour % WINDOW_HOURS]
+        return self.sums[hour % WINDOW_HOURS] / n if n else None
+
+    def _anchor(self, now_hour: int | None) -> int | None:
+        if self.head is None:
+            return None
+        if now_hour is None or now_hour - self.head <= MAX_LAG_HOURS:
+            return self.head
+        return now_hour  # station gone quiet: its old hours count as missing
+
+    def nowcast(self, now_hour: int | None = None) -> float | None:
+        """
+        EPA NowCast over the last 12 hours: weight factor = min/max clamped
+        to >= 0.5, hour i weighted w**i; needs 2 of the 3 most recent hours.
+        """
+        anchor = self._anchor(now_hour)
+        if anchor is None:
+            return None
+        c = [self.hourly(anchor - i) for i in range(NOWCAST_HOURS)]
+        if sum(x is not None for x in c[:3]) < 2:
+            return None
+        valid = [x for x in c if x is not None]
+        cmax, cmin = max(valid), min(valid)
+        w = max(cmin / cmax, 0.5) if cmax > 0 else 1.0
+        num = den = 0.0
+        f = 1.0
+        for x in c:
+            if x is not None:
+                num += f * x
+                den += f
+            f *= w
+        return round(num / den, 1)
+
+    def avg24(self, now_hour: int | None = None) -> float | None:
+        anchor = self._anchor(now_hour)
+        if anchor is None:
+            return None
+        vals = [v for v in (self.hourly(anchor - i) for i in range(WINDOW_HOURS)) if v is not None]
+        return round(sum(vals) / len(vals), 1) if len(vals) >= MIN_24H_HOURS else None
+
+class RollingEngine:
+    """
+    Process-local PM25Window per location. Ingest applies each bulk insert's
+    RETURNING rows inside the same transaction and upserts the touched
+    windows to rolling_state, so a restart loads state instead of rescanning
+    readings. Reloaded from the database after CACHE_TTL_SECONDS, like the
+    latest-state cache, to pick up other processes' writes.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows: dict[int, PM25Window] = {}
+        self._loaded_at: float | None = None
+
+    def _ensure_loaded(self, db: Session) -> set[int]:
+        """Load persisted state if missing/expired; returns locations seeded from raw readings."""
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < get_settings().cache_ttl_seconds:
+            return set()
+        self._windows = {
+            s.location_id: PM25Window(s.head_hour, array("d", s.sums), array("i", s.counts))
+            for s in db.execute(select(RollingState)).scalars()
+        }
+        # One-time seed for locations that have never had state (new install or new location)
+        missing = [lid for lid in db.execute(select(Location.id).where(Location.active.is_(True))).scalars()
+                   if lid not in self._windows]
+        seeded: set[int] = set()
+        if missing:
+            since = datetime.now(timezone.utc) - timedelta(hours=WINDOW_HOURS)
+            q = (select(Reading.location_id, Reading.observed_at, Reading.pm25_ugm3)
+                 .where(Reading.location_id.in_(missing), Reading.observed_at >= since))
+            for r in db.execute(q):
+                if r.pm25_ugm3 is not None:
+                    self._windows.setdefault(r.location_id, PM25Window()).add(_hour(r.observed_at), float(r.pm25_ugm3))
+                    seeded.add(r.location_id)
+        self._loaded_at = time.monotonic()
+        logger.debug(f"Rolling state loaded: {len(self._windows)} locations ({len(seeded)} seeded from readings)")
+        return seeded
+
+    def apply(self, db: Session, rows: Iterable) -> int:
+        """
+        Fold newly inserted reading rows (location_id, observed_at, pm25_ugm3)
+        in and stage the touched windows for the caller's transaction.
+        """
+        with self._lock:
+            # Seeded windows were built from readings that already include `rows`
+            seeded = self._ensure_loaded(db)
+            dirty = set(seeded)
+            for r in rows:
+                if r.pm25_ugm3 is None or r.location_id in seeded:
+                    continue
+                w = self._windows.get(r.location_id)
+                if w is None:
+                    w = self._windows[r.location_id] = PM25Window()
+                if w.add(_hour(r.observed_at), float(r.pm25_ugm3)):
+                    dirty.add(r.location_id)
+            self._save(db, dirty)
+        return len(dirty)
+
+    def _save(self, db: Session, location_ids: set[int]) -> None:
+        if not location_ids:
+            return
+        now = datetime.now(timezone.utc)
+        params = []
+        for lid in location_ids:
+            w = self._windows[lid]
+            params.append(dict(location_id=lid, head_hour=w.head, sums=w.sums.tobytes(),
+                               counts=w.counts.tobytes(), updated_at=now))
+        ins = _insert_for(db)(RollingState)
+        stmt = ins.on_conflict_do_update(
+            index_elements=[RollingState.location_id],
+            set_=dict(head_hour=ins.excluded.head_hour, sums=ins.excluded.sums,
+                      counts=ins.excluded.counts, updated_at=ins.excluded.updated_at),
+        )
+        db.execute(stmt, params)
+
+    def values(self, db: Session, location_ids: Iterable[int] | None = None,
+               now: datetime | None = None) -> dict[int, RollingValues]:
+        """NowCast and 24h average per location as of `now`; locations without data are omitted."""
+        now_hour = _hour(now or datetime.now(timezone.utc))
+        with self._lock:
+            self._ensure_loaded(db)
+            ids = self._windows.keys() if location_ids is None else location_ids
+            out = {}
+            for lid in ids:
+                w = self._windows.get(lid)
+                if w is not None:
+                    v = RollingValues(w.nowcast(now_hour), w.avg24(now_hour))
+                    if v.nowcast is not None or v.avg24 is not None:
+                        out[lid] = v
+            return out
+
+    def invalidate(self) -> None:
+        """Drop in-memory state (e.g. after a rolled-back ingest); reloaded on next use."""
+        with self._lock:
+            self._windows.clear()
+            self._loaded_at = None
+
+rolling = RollingEngine()
@@ -1,79 +1,220 @@
 from __future__ import annotations
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 from sqlalchemy.orm import Session
 from loguru import logger
 from datetime import datetime, timezone
-from .db import SessionLocal, create_all
-from .models import Location, Reading
-from .config import app_cfg, settings
-from .ingest.airnow_provider import AirNowProvider
+from .db import SessionLocal, ReadSession, create_all
+from .models import Location
+from .store import bulk_insert_readings
+from .cache import latest_cache
+from .metrics import readings_written, job_runs, provider_requests
+from .config import get_app_config, get_settings
 from .logic.evaluator import evaluate_and_generate_alerts
 from .notify.email_notifier import EmailNotifier
+from .notify.outbox import enqueue_alerts, drain_outbox
 from .logic.reporter import build_morning_digest_rows, render_digest_html
+from .logic.digest_template import iter_subscriber_digests
 from zoneinfo import ZoneInfo
 
+if TYPE_CHECKING:  # the HTTP stack (httpx, tenacity, providers) loads only when ingest runs
+    from .ingest.base_provider import BaseProvider, ReadingDTO
+
 
 def ensure_seed_locations(db: Session):
     names = {x.name for x in db.query(Location).all()}
-    for lc in app_cfg.locations:
+    for lc in get_app_config().locations:
         if lc.name not in names:
             db.add(Location(name=lc.name, lat=lc.lat, lon=lc.lon, active=True))
     db.commit()
 
-def ingest_once(db: Session):
-    provider = AirNowProvider()
-    for loc in db.query(Location).filter_by(active=True).all():
-        dtos = provider.fetch_by_location(loc.lat, loc.lon)
-        for dto in dtos:
-            # Upsert-like: rely on unique constraint to skip dupes
-            r = Reading(
-                location_id=loc.id,
-                provider=dto.provider,
-                observed_at=dto.observed_at,
-                pm25_ugm3=float(dto.pm25_ugm3),
-                aqi=dto.aqi,
-                raw_payload=None
-            )
-            try:
-                db.add(r)
-                db.commit()
-            except Exception as e:
-                db.rollback()  # likely a unique violation → skip
-    logger.info("Ingest complete.")
+_bootstrapped = False
+
+def bootstrap():
+    """Create schema, seed locations and warm the cache once per process."""
+    global _bootstrapped
+    if _bootstrapped:
+        return
+    create_all()
+    with SessionLocal() as db:
+        ensure_seed_locations(db)
+        latest_cache.warm(db)
+    _bootstrapped = True
+
+# Sync providers run here rather than on asyncio's default executor: asyncio.run()
+# joins that on exit, which would make a hung thread hold the cycle past its deadline
+_sync_fetch_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="sync-fetch")
+
+async def fetch_all_async(provider: BaseProvider, locations: list[Location], max_concurrency: int | None = None,
+                          timeout: float | None = None) -> dict[int, list[ReadingDTO]]:
+    """
+    Fetch every location over one pooled AsyncClient with at most
+    `max_concurrency` requests in flight. The provider decides how locations
+    map to upstream calls (see BaseProvider.afetch_for_locations). After
+    `timeout` seconds unfinished locations are cancelled and the rest kept.
+    """
+    import httpx
+    if not provider.async_mode:
+        return await _fetch_sync_until(provider, locations, timeout)
+    limit = max_concurrency or get_settings().ingest_concurrency
+    sem = asyncio.Semaphore(limit)
+    limits = httpx.Limits(max_connections=limit, max_keepalive_connections=limit)
+    deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
+    async with httpx.AsyncClient(limits=limits, timeout=get_settings().http_timeout_seconds) as client:
+        return await provider.afetch_for_locations(client, locations, sem, deadline)
+
+async def _fetch_sync_until(provider: BaseProvider, locations: list[Location],
+                            timeout: float | None) -> dict[int, list[ReadingDTO]]:
+    """
+    Run a sync provider on a worker thread. A thread can't be cancelled: it
+    stops starting new locations at the deadline, and if a request is still
+    hanging then, the locations finished so far are used and the thread is
+    left to finish in the background (logged and counted).
+    """
+    out: dict[int, list[ReadingDTO]] = {}
+    stop_at = None if timeout is None else time.monotonic() + timeout
+    fut = asyncio.get_running_loop().run_in_executor(_sync_fetch_pool, fetch_all_sync, provider, locations, out, stop_at)
+    done, _ = await asyncio.wait({fut}, timeout=timeout)
+    if done:
+        return fut.result()
+    provider_requests.inc(provider=provider.name, outcome="thread_overrun")
+    logger.error(f"{provider.name}: sync fetch still running at the deadline; keeping {len(out)}/{len(locations)} "
+                 f"locations, thread left running")
+    return dict(out)
+
+def fetch_all_sync(provider: BaseProvider, locations: list[Location], out: dict | None = None,
+                   stop_at: float | None = None) -> dict[int, list[ReadingDTO]]:
+    """Fetch locations one by one into `out`, starting none after `stop_at` (time.monotonic())."""
+    out = {} if out is None else out
+    for i, loc in enumerate(locations):
+        if stop_at is not None and time.monotonic() >= stop_at:
+            provider_requests.inc(len(locations) - i, provider=provider.name, outcome="deadline_missed")
+            logger.error(f"{provider.name}: {len(locations) - i}/{len(locations)} locations skipped at the fetch deadline")
+            break
+        try:
+            out[loc.id] = provider.fetch_by_location(loc.lat, loc.lon)
+        except Exception as e:
+            logger.warning(f"{provider.name}: fetch failed for {loc.name}: {e!r}")
+    return out
+
+async def fetch_providers_async(providers: list[BaseProvider], locations: list[Location],
+                                deadline_seconds: float | None = None) -> dict[str, dict[int, list[ReadingDTO]]]:
+    """
+    Run every provider in parallel, each with its own connection pool and
+    PROVIDER_TIMEOUT_SECONDS budget (capped by the cycle deadline), so a slow
+    or failing source only costs its own readings for this cycle. The budget
+    applies per location: whatever finished in time is kept.
+    """
+    budget = get_settings().provider_timeout_seconds
+    if deadline_seconds is not None:
+        budget = min(budget, deadline_seconds)
+
+    results = await asyncio.gather(*(fetch_all_async(p, locations, timeout=budget) for p in providers),
+                                   return_exceptions=True)
+    out: dict[str, dict[int, list[ReadingDTO]]] = {}
+    for p, res in zip(providers, results):
+        if isinstance(res, BaseException):
+            logger.error(f"{p.name}: provider failed this cycle: {res!r}")
+            continue
+        if len(res) < len(locations):
+            job_runs.inc(job=f"fetch_{p.name}", outcome="partial")
+        out[p.name] = res
+    return out
+
+def fetch_all(providers: list[BaseProvider], locations: list[Location],
+              deadline_seconds: float | None = None) -> dict[str, dict[int, list[ReadingDTO]]]:
+    return asyncio.run(fetch_providers_async(providers, locations, deadline_seconds))
+
+def ingest_once(db: Session, providers: list[BaseProvider] | None = None,
+                deadline_seconds: float | None = None, shard: tuple[int, int] | None = None):
+    """
+    Fetch and store one cycle for every active location, or with
+    shard=(index, count) only those with id % count == index (see shards.py).
+    """
+    from .ingest.providers import get_providers
+    from .ingest.spatial import nearest_per_hour
+    providers = providers or get_providers()
+    q = db.query(Location).filter_by(active=True)
+    if shard is not None:
+        q = q.filter(Location.id % shard[1] == shard[0])
+    locations = q.all()
+    fetched = fetch_all(providers, locations, deadline_seconds)
+    now = datetime.now(timezone.utc)
+    by_id = {loc.id: loc for loc in locations}
+    fetched_rows = sum(len(dtos) for by_loc in fetched.values() for dtos in by_loc.values())
+    # All providers' readings merge into one bulk write; uq_reading_unique keys on provider too,
+    # so each location keeps one station per (hour, provider) before the write
+    rows = [
+        dict(
+            location_id=loc_id,
+            provider=dto.provider,
+            observed_at=dto.observed_at,
+            pm25_ugm3=float(dto.pm25_ugm3),
+            aqi=dto.aqi,
+            raw_payload=None,
+            ingested_at=now,
+        )
+        for by_loc in fetched.values()
+        for loc_id, dtos in by_loc.items()
+        for dto in nearest_per_hour(by_id[loc_id].lat, by_id[loc_id].lon, dtos)
+    ]
+    result = bulk_insert_readings(db, rows)
+    latest_cache.put_readings(result.inserted)
+    readings_written.inc(len(result.inserted), result="inserted")
+    readings_written.inc(result.skipped, result="duplicate")
+    for p in providers:
+        logger.info(f"{p.name}: {len(fetched.get(p.name, {}))}/{len(locations)} locations, stats={p.stats.as_dict()}")
+    logger.info(
+        f"Ingest complete{f' (shard {shard[0]}/{shard[1]})' if shard else ''}: {len(locations)} locations, {len(rows)} rows from {len(fetched)}/{len(providers)} providers "
+        f"({fetched_rows - len(rows)} farther stations dropped), "
+        f"{len(result.inserted)} readings inserted, {result.skipped} duplicates skipped."
+    )
+    return result
 
 def evaluate_and_notify(db: Session):
+    """Evaluate and queue fired alerts in the outbox; delivery happens in drain_notifications."""
     alerts = evaluate_and_generate_alerts(db, tz_str="America/Los_Angeles")
     if not alerts:
         return
-    notifier = EmailNotifier()
-    for a in alerts:
-        loc = db.query(Location).get(a.location_id)
-        subject = f"[AQI Alert] {loc.name}: PM2.5 {a.observed_value:.1f} µg/m³ ≥ {a.threshold_value:.0f}"
-        body = (
-            f"Location: {loc.name}\n"
-            f"Observed PM2.5: {a.observed_value:.1f} µg/m³\n"
-            f"Threshold: {a.threshold_value:.0f} µg/m³\n"
-            f"Time (UTC): {datetime.now(timezone.utc).isoformat()}\n"
-            f"Provider: AirNow\n"
-        )
-        notifier.send(subject, body, settings.email_to)
+    queued = enqueue_alerts(db, alerts, get_settings().email_to)
+    logger.info(f"Queued {queued} alert notifications for {len(alerts)} alerts.")
 
-def run_once():
-    create_all()
+def drain_notifications(flush: bool = False):
     with SessionLocal() as db:
-        ensure_seed_locations(db)
-        ingest_once(db)
+        drain_outbox(db, flush=flush)
+
+def run_retention():
+    """Archive readings past RETENTION_DAYS to Parquet and prune them from the hot table."""
+    from .archive import archive_readings
+    with SessionLocal() as db:
+        result = archive_readings(db)
+    logger.info(f"Retention complete: {result}")
+    return result
+
+def run_once(deadline_seconds: float | None = None):
+    bootstrap()
+    with SessionLocal() as db:
+        ingest_once(db, deadline_seconds=deadline_seconds)
         #evaluate_and_notify(db)
 
 def send_morning_digest():
-    create_all()
-    with SessionLocal() as db:
-        ensure_seed_locations(db)
+    bootstrap()
+    settings, app_cfg = get_settings(), get_app_config()
+    with ReadSession() as db:
         rows = build_morning_digest_rows(db, settings.default_threshold_pm25)
-        if not rows:
-            logger.info("Morning digest: no rows to send.")
-            return
-        html = render_digest_html(rows, settings.default_threshold_pm25, tz_str="America/Los_Angeles")
-        subject = "[AQI Morning Digest] Air Quality Overview"
-        EmailNotifier().send(subject, html, settings.email_to, content_type="html")
-        logger.info("Morning digest sent.")
-
+    if not rows:
+        logger.info("Morning digest: no rows to send.")
+        return
+    subject = "[AQI Morning Digest] Air Quality Overview"
+    if app_cfg.subscribers:
+        # Personalised: each subscriber's cities/threshold, rendered from cached rows, one SMTP session
+        now_local = datetime.now(ZoneInfo("America/Los_Angeles"))
+        digests = iter_subscriber_digests(rows, app_cfg.subscribers, settings.default_threshold_pm25, now_local)
+        sent, failed = EmailNotifier().send_many((subject, html, [email], "html") for email, html in digests)
+        logger.info(f"Morning digest sent to {sent} subscribers" + (f", {failed} failed." if failed else "."))
+        return
+    html = render_digest_html(rows, settings.default_threshold_pm25, tz_str="America/Los_Angeles")
+    EmailNotifier().send(subject, html, settings.email_to, content_type="html")
+    logger.info("Morning digest sent.")
@@ -0,0 +1,285 @@
+from __future__ import annotations
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from .db import SessionLocal
+from .models import ShardLease, WorkerHeartbeat
+from .store import _insert_for
+from .metrics import shard_lease_events, job_runs
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def _utc(dt: datetime | None) -> datetime | None:
+    if dt is None:
+        return None
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+def ensure_shards(db: Session, shard_count: int) -> None:
+    """
+    Create lease rows 0..shard_count-1. Re-sharding is only allowed once no
+    worker holds a live lease under the old count, so two fleets never
+    partition the same locations differently.
+    """
+    now = _now()
+    rows = db.execute(select(ShardLease)).scalars().all()
+    if rows and any(r.shard_count != shard_count for r in rows):
+        live = [r for r in rows if r.owner and r.expires_at and _utc(r.expires_at) > now]
+        if live:
+            raise RuntimeError(
+                f"{len(live)} shard(s) are leased under shard_count={live[0].shard_count}; "
+                f"stop those workers (or wait for their leases to expire) before using --shards {shard_count}"
+            )
+        db.execute(delete(ShardLease))
+        rows = []
+    have = {r.shard for r in rows}
+    db.add_all(ShardLease(shard=s, shard_count=shard_count, generation=0) for s in range(shard_count) if s not in have)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # a peer starting at the same moment created them first
+
+def beat(db: Session, owner: str, ttl: timedelta) -> None:
+    """
+    Register/renew this worker's presence. Presence is separate from leases so
+    a worker that holds nothing yet still counts toward everyone's fair share.
+    """
+    now = _now()
+    ins = _insert_for(db)(WorkerHeartbeat)
+    db.execute(ins.values(worker_id=owner, started_at=now, heartbeat_at=now, expires_at=now + ttl)
+               .on_conflict_do_update(index_elements=[WorkerHeartbeat.worker_id],
+                                      set_=dict(heartbeat_at=now, expires_at=now + ttl)))
+    # Housekeeping: forget workers that have been gone for a while
+    db.execute(delete(WorkerHeartbeat).where(WorkerHeartbeat.expires_at < now - 10 * ttl))
+    db.commit()
+
+def retire(db: Session, owner: str) -> None:
+    db.execute(delete(WorkerHeartbeat).where(WorkerHeartbeat.worker_id == owner))
+    db.commit()
+
+def fair_share(db: Session, owner: str, shard_count: int) -> int:
+    """
+    This worker's share among live workers: shard_count split as evenly as
+    possible, the remainder going to the lowest worker ids, so shares always
+    sum to shard_count and no worker is left idle while another holds two.
+    """
+    now = _now()
+    live = set(db.execute(select(WorkerHeartbeat.worker_id).where(WorkerHeartbeat.expires_at > now)).scalars())
+    ranked = sorted(live | {owner})
+    k = len(ranked)
+    return shard_count // k + (1 if ranked.index(owner) < shard_count % k else 0)
+
+def _claim(db: Session, owner: str, shard: int, ttl: timedelta) -> bool:
+    """
+    Conditional UPDATE: succeeds only if the shard is free, expired or already
+    ours, so two workers racing for it can't both win (the row lock/write
+    lock serializes them and the loser's WHERE no longer matches).
+    """
+    now = _now()
+    res = db.execute(
+        update(ShardLease)
+        .where(and_(ShardLease.shard == shard,
+                    or_(ShardLease.owner.is_(None), ShardLease.expires_at < now, ShardLease.owner == owner)))
+        .values(owner=owner, expires_at=now + ttl, heartbeat_at=now, generation=ShardLease.generation + 1)
+    )
+    db.commit()
+    return res.rowcount == 1
+
+def claim_shards(db: Session, owner: str, held: set[int], ttl: timedelta, max_shards: int | None = None) -> set[int]:
+    """
+    Top up to this worker's fair share (see fair_share, capped by
+    `max_shards`) from free or expired leases. Expired ones are takeovers of
+    a dead peer. Returns the newly claimed shards.
+    """
+    now = _now()
+    rows = db.execute(select(ShardLease).order_by(ShardLease.shard)).scalars().all()
+    want = fair_share(db, owner, len(rows))
+    if max_shards:
+        want = min(want, max_shards)
+    claimed: set[int] = set()
+    for r in rows:
+        if len(held) + len(claimed) >= want:
+            break
+        if r.shard in held:
+            continue
+        expired = r.owner is not None and (r.expires_at is None or _utc(r.expires_at) <= now)
+        if (r.owner is None or expired) and _claim(db, owner, r.shard, ttl):
+            claimed.add(r.shard)
+            event = "takeover" if expired else "claim"
+            shard_lease_events.inc(event=event)
+            logger.info(f"Shard {r.shard}: {event}" + (f" from {r.owner}" if expired else ""))
+    return claimed
+
+def excess_shards(db: Session, owner: str, held: set[int], max_shards: int | None = None) -> set[int]:
+    """Shards beyond this worker's fair share now that more peers are live; released for them to claim."""
+    shard_count = db.execute(select(func.count()).select_from(ShardLease)).scalar()
+    fair = fair_share(db, owner, shard_count)
+    if max_shards:
+        fair = min(fair, max_shards)
+    return set(sorted(held)[fair:])
+
+def renew(db: Session, owner: str, held: set[int], ttl: timedelta) -> set[int]:
+    """Extend our leases; returns the shards we still own (a lease that lapsed and was taken is lost)."""
+    if not held:
+        return set()
+    now = _now()
+    db.execute(
+        update(ShardLease)
+        .where(and_(ShardLease.shard.in_(held), ShardLease.owner == owner))
+        .values(expires_at=now + ttl, heartbeat_at=now)
+    )
+    db.commit()
+    still = set(db.execute(
+        select(ShardLease.shard).where(and_(ShardLease.shard.in_(held), ShardLease.owner == owner))
+    ).scalars())
+    for s in held - still:
+        shard_lease_events.inc(event="lost")
+        logger.warning(f"Shard {s}: lease lost to another worker")
+    return still
+
+def release(db: Session, owner: str, shards: set[int]) -> None:
+    if not shards:
+        return
+    db.execute(
+        update(ShardLease)
+        .where(and_(ShardLease.shard.in_(shards), ShardLease.owner == owner))
+        .values(owner=None, expires_at=None)
+    )
+    db.commit()
+    shard_lease_events.inc(len(shards), event="release")
+
+def due_shards(db: Session, owner: str, held: set[int], interval: timedelta) -> list[int]:
+    """Held shards whose last run (by any owner) is older than `interval`, most overdue first."""
+    if not held:
+        return []
+    cutoff = _now() - interval
+    rows = db.execute(
+        select(ShardLease.shard, ShardLease.last_run_at)
+        .where(and_(ShardLease.shard.in_(held), ShardLease.owner == owner))
+    ).all()
+    due = [(_utc(r.last_run_at) or EPOCH, r.shard) for r in rows
+           if r.last_run_at is None or _utc(r.last_run_at) <= cutoff]
+    return [s for _, s in sorted(due)]
+
+def mark_run(db: Session, owner: str, shard: int, started_at: datetime) -> bool:
+    """Record a completed cycle; False if the lease moved on while we were running."""
+    res = db.execute(
+        update(ShardLease)
+        .where(and_(ShardLease.shard == shard, ShardLease.owner == owner))
+        .values(last_run_at=started_at)
+    )
+    db.commit()
+    return res.rowcount == 1
+
+class _Heartbeat(threading.Thread):
+    """
+    Renews presence and held leases every ttl/3 on its own session, so a long
+    ingest cycle neither lets leases lapse nor hides the worker from its peers.
+    """
+    def __init__(self, worker: "ShardWorker"):
+        super().__init__(name="shard-heartbeat", daemon=True)
+        self.worker = worker
+        self.stop = threading.Event()
+
+    def run(self):
+        w = self.worker
+        while not self.stop.wait(w.ttl.total_seconds() / 3):
+            try:
+                with SessionLocal() as db:
+                    beat(db, w.owner, w.ttl)
+                    with w.lock:
+                        w.held = renew(db, w.owner, w.held, w.ttl)
+            except Exception as e:
+                logger.warning(f"Lease heartbeat failed: {e!r}")
+
+class ShardWorker:
+    """
+    Ingest loop for one process in a sharded fleet. Each shard is the set of
+    active locations with id % shard_count == shard. A worker claims its fair
+    share of shards, renews them from a heartbeat thread, runs each one when
+    its last_run_at is older than the interval, and takes over shards whose
+    leases expired. last_run_at lives on the lease row, so a takeover carries
+    on the schedule instead of refetching a shard that was just ingested.
+    """
+    def __init__(self, shard_count: int, interval_minutes: float = 60, lease_seconds: float = 90,
+                 poll_seconds: float = 10, max_shards: int | None = None, owner: str | None = None):
+        self.shard_count = shard_count
+        self.interval = timedelta(minutes=interval_minutes)
+        self.ttl = timedelta(seconds=lease_seconds)
+        self.poll_seconds = poll_seconds
+        self.max_shards = max_shards
+        self.owner = owner or new_worker_id()
+        self.held: set[int] = set()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def tick(self) -> int:
+        """Claim/rebalance, then ingest every due shard we hold. Returns shards ingested."""
+        from .runner import ingest_once
+        with SessionLocal() as db:
+            with self.lock:
+                self.held |= claim_shards(db, self.owner, self.held, self.ttl, self.max_shards)
+                held = set(self.held)
+            due = due_shards(db, self.owner, held, self.interval)
+        ran = 0
+        for shard in due:
+            if self._stop.is_set():
+                break
+            started = _now()
+            outcome = "ok"
+            try:
+                with SessionLocal() as db:
+                    ingest_once(db, shard=(shard, self.shard_count),
+                                deadline_seconds=self.interval.total_seconds() * 0.9)
+                    if not mark_run(db, self.owner, shard, started):
+                        outcome = "lease_lost"
+                ran += 1
+            except Exception as e:
+                outcome = "error"
+                logger.error(f"Shard {shard}: ingest failed: {e!r}")
+            job_runs.inc(job="ingest_shard", outcome=outcome)
+        with SessionLocal() as db:
+            with self.lock:
+                extra = excess_shards(db, self.owner, self.held, self.max_shards)
+                if extra:
+                    release(db, self.owner, extra)
+                    self.held -= extra
+                    logger.info(f"Released shards {sorted(extra)} to rebalance")
+        return ran
+
+    def run(self) -> None:
+        with SessionLocal() as db:
+            ensure_shards(db, self.shard_count)
+            beat(db, self.owner, self.ttl)
+        logger.info(f"Worker {self.owner}: {self.shard_count} shards, lease {self.ttl.total_seconds():.0f}s, "
+                    f"interval {self.interval.total_seconds() / 60:.0f}m")
+        hb = _Heartbeat(self)
+        hb.start()
+        try:
+            while not self._stop.is_set():
+                self.tick()
+                self._stop.wait(self.poll_seconds)
+        finally:
+            hb.stop.set()
+            hb.join()
+            with SessionLocal() as db:
+                with self.lock:
+                    release(db, self.owner, self.held)
+                    self.held.clear()
+                retire(db, self.owner)
+            logger.info(f"Worker {self.owner} stopped; leases released")
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import math
+from collections import defaultdict
+from typing import NamedTuple, Sequence
+
+from .base_provider import ReadingDTO
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEG_LAT = 69.0
+
+def haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+class Cluster(NamedTuple):
+    lat: float
+    lon: float
+    radius_miles: float  # farthest member from the centroid
+    members: list        # Location-like objects with .id/.lat/.lon
+
+def plan_clusters(locations: Sequence, cell_miles: float) -> list[Cluster]:
+    """
+    Bucket locations into a lat/lon grid of roughly `cell_miles` squares; each
+    non-empty cell becomes one upstream query at its centroid. cell_miles <= 0
+    disables clustering (one cluster per location).
+    """
+    if cell_miles <= 0:
+        return [Cluster(loc.lat, loc.lon, 0.0, [loc]) for loc in locations]
+    dlat = cell_miles / MILES_PER_DEG_LAT
+    cells: dict[tuple[int, int], list] = defaultdict(list)
+    for loc in locations:
+        dlon = cell_miles / (MILES_PER_DEG_LAT * max(math.cos(math.radians(loc.lat)), 0.01))
+        cells[(math.floor(loc.lat / dlat), math.floor(loc.lon / dlon))].append(loc)
+    out: list[Cluster] = []
+    for members in cells.values():
+        clat = sum(m.lat for m in members) / len(members)
+        clon = sum(m.lon for m in members) / len(members)
+        radius = max(haversine_miles(clat, clon, m.lat, m.lon) for m in members)
+        out.append(Cluster(clat, clon, radius, members))
+    return out
+
+def assign_to_members(members: Sequence, dtos: list[ReadingDTO], radius_miles: float,
+                      homes: dict[int, tuple[float, float]] | None = None) -> dict[int, list[ReadingDTO]]:
+    """
+    Map station rows from a cluster query back to every member within
+    `radius_miles` of the station — the same radius a per-location query uses.
+    Rows without station coordinates can't be placed and are dropped. With
+    `homes` (member id -> station coordinates its own query returns), a
+    member only takes rows from that station, and members missing from it
+    take none.
+    """
+    out: dict[int, list[ReadingDTO]] = {}
+    for dto in dtos:
+        if dto.station_lat is None or dto.station_lon is None:
+            continue
+        for m in members:
+            if homes is not None and homes.get(m.id) != (dto.station_lat, dto.station_lon):
+                continue
+            if haversine_miles(m.lat, m.lon, dto.station_lat, dto.station_lon) <= radius_miles:
+                out.setdefault(m.id, []).append(dto)
+    return out
+
+def nearest_per_hour(lat: float, lon: float, dtos: list[ReadingDTO]) -> list[ReadingDTO]:
+    """
+    One row per (hour, provider) for a location at lat/lon: the station
+    nearest to it, or the mean when no row says where its station is.
+    Radius queries return every station around the point, all truncated to
+    the same hour, and uq_reading_unique keeps only one of them anyway.
+    """
+    groups: dict[tuple, list[ReadingDTO]] = defaultdict(list)
+    for dto in dtos:
+        groups[(dto.observed_at, dto.provider)].append(dto)
+    out: list[ReadingDTO] = []
+    for group in groups.values():
+        if len(group) == 1:
+            out.append(group[0])
+            continue
+        placed = [d for d in group if d.station_lat is not None and d.station_lon is not None]
+        if placed:
+            out.append(min(placed, key=lambda d: haversine_miles(lat, lon, d.station_lat, d.station_lon)))
+        else:
+            mean = sum(d.pm25_ugm3 for d in group) / len(group)
+            aqis = [d.aqi for d in group if d.aqi is not None]
+            out.append(group[0].model_copy(update=dict(
+                pm25_ugm3=mean, aqi=round(sum(aqis) / len(aqis)) if aqis else None)))
+    return out
@@ -0,0 +1,103 @@
+from __future__ import annotations
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from zoneinfo import ZoneInfo
+from loguru import logger
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+AIRNOW_TZ = ZoneInfo("America/Los_Angeles")
+
+AREA_GRID_DEG = 0.25  # synthetic reporting areas sit on this lat/lon grid
+
+def airnow_rows(lat: float, lon: float, now: datetime | None = None) -> list[dict]:
+    """
+    AirNow latLong/current-shaped rows for the synthetic reporting area
+    nearest (lat, lon), like the real endpoint: PM2.5, O3 and PM10 for the
+    current local hour. Values are deterministic per area and hour so
+    repeated polls return the same data.
+    """
+    lat = round(lat / AREA_GRID_DEG) * AREA_GRID_DEG
+    lon = round(lon / AREA_GRID_DEG) * AREA_GRID_DEG
+    local = (now or datetime.now(timezone.utc)).astimezone(AIRNOW_TZ)
+    rng = random.Random(f"{lat:.2f},{lon:.2f},{local:%Y%m%d%H}")
+    rows = []
+    for param in ("O3", "PM2.5", "PM10"):
+        aqi = rng.randint(15, 180)
+        rows.append({
+            "DateObserved": local.strftime("%Y-%m-%d "),
+            "HourObserved": local.hour,
+            "LocalTimeZone": local.tzname(),
+            "ReportingArea": f"Area {lat:.2f},{lon:.2f}",
+            "StateCode": "CA",
+            "Latitude": round(lat, 4),
+            "Longitude": round(lon, 4),
+            "ParameterName": param,
+            "AQI": aqi,
+            "Category": {"Number": 1 + min(aqi // 50, 5), "Name": "synthetic"},
+        })
+    return rows
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0):
+        super().__init__(addr, _Handler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StandinServer
+
+    def log_message(self, fmt, *args):  # keep benchmark output quiet
+        pass
+
+    def _reply(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        srv = self.server
+        delay = srv.latency_ms + random.uniform(0, srv.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+        fail = random.random() < srv.error_rate
+        with srv._lock:
+            srv.requests += 1
+            srv.errors += int(fail)
+        if fail:
+            return self._reply(503, {"error": "injected failure"})
+
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        if url.path == "/aq/observation/latLong/current":
+            return self._reply(200, airnow_rows(float(q["latitude"]), float(q["longitude"])))
+        if url.path == "/v2/latest":
+            return self._reply(200, json.loads((FIXTURES / "openaq_latest.json").read_text()))
+        return self._reply(404, {"error": "not found"})
+
+def start_standin(port: int = 0, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                  error_rate: float = 0.0) -> StandinServer:
+    """Serve AirNow/OpenAQ-shaped JSON on 127.0.0.1 from a daemon thread; call .shutdown() to stop."""
+    srv = StandinServer(("127.0.0.1", port), latency_ms, jitter_ms, error_rate)
+    threading.Thread(target=srv.serve_forever, name="provider-standin", daemon=True).start()
+    logger.info(f"Provider stand-in on {srv.base_url} (latency={latency_ms}ms, errors={error_rate:.0%})")
+    return srv
@@ -0,0 +1,195 @@
+from __future__ import annotations
+from datetime import date, datetime, timezone
+from typing import Iterable, NamedTuple
+from sqlalchemy import and_, case, delete, func
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Row
+from sqlalchemy.dialects import sqlite, postgresql
+from loguru import logger
+
+from .models import Reading, DailyRollup
+
+class BulkWriteResult(NamedTuple):
+    inserted: list[Row]  # RETURNING rows for readings that were actually new
+    skipped: int         # duplicates already present (or repeated within the batch)
+
+def _insert_for(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert
+    if dialect == "postgresql":
+        return postgresql.insert
+    raise NotImplementedError(f"bulk upsert not supported for dialect {dialect!r}")
+
+def _utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+def bulk_insert_readings(db: Session, rows: Iterable[dict]) -> BulkWriteResult:
+    """
+    Insert reading dicts (Reading column names as keys) in one transaction,
+    letting uq_reading_unique drop duplicates via ON CONFLICT DO NOTHING.
+    Daily rollups and rolling NowCast windows for the newly inserted rows are
+    updated in the same transaction.
+    """
+    from .rolling import rolling
+    rows = list(rows)
+    if not rows:
+        return BulkWriteResult([], 0)
+    stmt = (
+        _insert_for(db)(Reading)
+        .on_conflict_do_nothing(index_elements=["location_id", "observed_at", "provider"])
+        .returning(Reading.id, Reading.location_id, Reading.provider,
+                   Reading.observed_at, Reading.pm25_ugm3, Reading.aqi)
+    )
+    try:
+        # executemany + RETURNING: SQLAlchemy batches this into multi-row VALUES within dialect limits
+        inserted = db.execute(stmt, rows).all()
+        upsert_rollups(db, inserted)
+        rolling.apply(db, inserted)
+        db.commit()
+    except Exception:
+        db.rollback()
+        rolling.invalidate()  # memory may be ahead of what was rolled back
+        raise
+    result = BulkWriteResult(inserted, len(rows) - len(inserted))
+    logger.debug(f"Bulk insert: {len(result.inserted)} inserted, {result.skipped} skipped")
+    return result
+
+def _aggregate(rows: Iterable) -> dict[tuple[int, date], dict]:
+    """Fold reading rows (location_id, observed_at, pm25_ugm3) into per (location, UTC day) rollup deltas."""
+    acc: dict[tuple[int, date], dict] = {}
+    for r in rows:
+        if r.pm25_ugm3 is None:
+            continue
+        ts = _utc(r.observed_at)
+        pm = float(r.pm25_ugm3)
+        key = (r.location_id, ts.date())
+        a = acc.get(key)
+        if a is None:
+            acc[key] = dict(location_id=key[0], day=key[1], reading_count=1, pm25_sum=pm,
+                            pm25_max=pm, pm25_min=pm, last_observed_at=ts, last_pm25=pm)
+            continue
+        a["reading_count"] += 1
+        a["pm25_sum"] += pm
+        a["pm25_max"] = max(a["pm25_max"], pm)
+        a["pm25_min"] = min(a["pm25_min"], pm)
+        if ts > a["last_observed_at"]:
+            a["last_observed_at"], a["last_pm25"] = ts, pm
+    return acc
+
+def upsert_rollups(db: Session, rows: Iterable) -> int:
+    """
+    Merge newly inserted readings into daily_rollups without committing.
+    Only genuinely new rows may be passed (duplicates would be double-counted),
+    which is what bulk_insert_readings' RETURNING set guarantees; late-arriving
+    readings for past days merge exactly.
+    """
+    deltas = list(_aggregate(rows).values())
+    if not deltas:
+        return 0
+    sqlite_db = db.get_bind().dialect.name == "sqlite"
+    greatest = func.max if sqlite_db else func.greatest  # SQLite's 2-arg max()/min() are scalar
+    least = func.min if sqlite_db else func.least
+    ins = _insert_for(db)(DailyRollup)
+    ex = ins.excluded
+    newer = ex.last_observed_at > DailyRollup.last_observed_at
+    stmt = ins.on_conflict_do_update(
+        index_elements=["location_id", "day"],
+        set_={
+            "reading_count": DailyRollup.reading_count + ex.reading_count,
+            "pm25_sum": DailyRollup.pm25_sum + ex.pm25_sum,
+            "pm25_max": greatest(DailyRollup.pm25_max, ex.pm25_max),
+            "pm25_min": least(DailyRollup.pm25_min, ex.pm25_min),
+            "last_pm25": case((newer, ex.last_pm25), else_=DailyRollup.last_pm25),
+            "last_observed_at": case((newer, ex.last_observed_at), else_=DailyRollup.last_observed_at),
+        },
+    )
+    db.execute(stmt, deltas)
+    return len(deltas)
+
+def backfill_rollups(db: Session, start: date | None = None, end: date | None = None,
+                     chunk: int = 5000) -> int:
+    """
+    Rebuild daily_rollups from raw readings for [start, end) (all history when
+    omitted), including months moved to the archive by the retention job.
+    Streams readings so memory stays bounded.
+    """
+    from .archive import iter_readings
+    cond = []
+    start_ts = end_ts = None
+    if start is not None:
+        cond.append(DailyRollup.day >= start)
+        start_ts = datetime(start.year, start.month, start.day, tzinfo=timezone.utc)
+    if end is not None:
+        cond.append(DailyRollup.day < end)
+        end_ts = datetime(end.year, end.month, end.day, tzinfo=timezone.utc)
+    db.execute(delete(DailyRollup).where(and_(*cond)) if cond else delete(DailyRollup))
+
+    written = 0
+    batch: list = []
+    for row in iter_readings(db, start_ts, end_ts, chunk=chunk):
+        batch.append(row)
+        if len(batch) >= chunk:
+            written += upsert_rollups(db, batch)
+            batch.clear()
+    written += upsert_rollups(db, batch)
+    db.commit()
+    logger.info(f"Rollup backfill: {written} location-day upserts")
+    return written
+
+def fix_airnow_times(db: Session, before: datetime, host_tz: str = "UTC",
+                     area_tz: str = "America/Los_Angeles") -> dict:
+    """
+    One-off repair for AirNow readings ingested before `before` by the old
+    dateutil parser. It couldn't resolve abbreviations like PDT, so it read
+    the reporting area's local wall-clock hour in the ingest host's zone
+    (`host_tz`). On a UTC host those rows sit 7-8 hours early, and their keys
+    no longer dedupe against correctly stamped rows for the same hour.
+
+    Each such row is re-stamped as `area_tz` wall-clock time. A row whose
+    corrected key already exists is a duplicate and is deleted. Then the
+    affected days' rollups and rolling windows are rebuilt. Archived months
+    are left as they are.
+    Run it once: a second run would shift the same rows again.
+    """
+    from zoneinfo import ZoneInfo
+    from sqlalchemy import select, update
+    from sqlalchemy.exc import IntegrityError
+    from .cache import latest_cache
+    from .models import RollingState
+    from .rolling import rolling
+
+    host, area = ZoneInfo(host_tz), ZoneInfo(area_tz)
+    # Latest first: corrections move rows later, so a row's new slot is vacated before it's needed
+    rows = db.execute(
+        select(Reading.id, Reading.location_id, Reading.observed_at)
+        .where(Reading.provider == "airnow", Reading.ingested_at < before)
+        .order_by(Reading.observed_at.desc())
+    ).all()
+    moved = dropped = 0
+    first_day: date | None = None
+    locations: set[int] = set()
+    for r in rows:
+        old = _utc(r.observed_at)
+        fixed = old.astimezone(host).replace(tzinfo=area).astimezone(timezone.utc)
+        if fixed == old:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(update(Reading).where(Reading.id == r.id).values(observed_at=fixed))
+            moved += 1
+        except IntegrityError:
+            db.execute(delete(Reading).where(Reading.id == r.id))
+            dropped += 1
+        locations.add(r.location_id)
+        first_day = min(filter(None, (first_day, old.date(), fixed.date())))
+    db.commit()
+    if first_day is not None:
+        backfill_rollups(db, start=first_day)
+        db.execute(delete(RollingState).where(RollingState.location_id.in_(locations)))
+        db.commit()
+        rolling.invalidate()  # windows for these locations reseed from the corrected readings
+        latest_cache.invalidate()
+    logger.info(f"AirNow time repair: {moved} readings re-stamped, {dropped} duplicates removed")
+    return {"checked": len(rows), "moved": moved, "duplicates_removed": dropped,
+            "since": first_day.isoformat() if first_day else None}
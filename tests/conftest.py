@@ -0,0 +1,27 @@
+import pytest
+
+from src.config import get_settings
+from src.db import get_engine, get_read_engine, get_read_sessionmaker, get_sessionmaker
+
+_CACHED = (get_settings, get_engine, get_read_engine, get_sessionmaker, get_read_sessionmaker)
+
+
+@pytest.fixture
+def settings_env(monkeypatch):
+    """setenv() that also drops cached settings/engines, so the next call sees the new environment."""
+    def setenv(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        for cached in _CACHED:
+            cached.cache_clear()
+    yield setenv
+    for cached in _CACHED:
+        cached.cache_clear()
+
+
+@pytest.fixture
+def db_path(tmp_path, settings_env):
+    path = tmp_path / "aqi.db"
+    path.touch()
+    settings_env(DB_URL=f"sqlite:///{path}")
+    return path
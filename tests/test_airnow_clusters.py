@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from src.db import SessionLocal, create_all
+from src.ingest.airnow_provider import AirNowProvider
+from src.ingest.response_cache import response_cache
+from src.models import Location
+from src.runner import fetch_all_async
+from src.standin import start_standin
+
+# Two synthetic reporting areas (the stand-in snaps to a 0.25° grid): three
+# San Francisco points share one, two Oakland points the other.
+POINTS = {
+    "SF Mission": (37.76, -122.42), "SF Sunset": (37.75, -122.48), "SF Richmond": (37.78, -122.46),
+    "Oakland": (37.80, -122.27), "Berkeley": (37.87, -122.27),
+}
+
+
+@pytest.fixture
+def standin():
+    srv = start_standin()
+    yield srv
+    srv.shutdown()
+
+
+def test_locations_in_one_area_share_a_query(db_path, settings_env, standin, monkeypatch):
+    settings_env(DB_URL=f"sqlite:///{db_path}", AIRNOW_BASE_URL=standin.base_url,
+                 CLUSTER_CELL_MILES=40)
+    monkeypatch.setattr(response_cache, "_max_entries", 0)  # count real upstream requests
+    create_all()
+    with SessionLocal() as db:
+        db.add_all(Location(name=n, lat=lat, lon=lon, active=True) for n, (lat, lon) in POINTS.items())
+        db.commit()
+        locations = db.query(Location).order_by(Location.id).all()
+
+    def cycle():
+        before = standin.requests
+        out = asyncio.run(fetch_all_async(AirNowProvider(), locations))
+        return standin.requests - before, out
+
+    first, own = cycle()
+    assert first == len(locations)  # nothing learned yet: every location queries alone
+    for _ in range(2):
+        requests, shared = cycle()
+        assert requests < len(locations)  # at most one per (grid cell, reporting area)
+        # each location still gets exactly what its own query returned
+        assert {lid: {(d.station_lat, d.station_lon) for d in dtos} for lid, dtos in shared.items()} == \
+               {lid: {(d.station_lat, d.station_lon) for d in dtos} for lid, dtos in own.items()}
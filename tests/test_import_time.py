@@ -0,0 +1,7 @@
+from src.bench import import_time
+
+
+def test_cli_import_stays_lazy():
+    result = import_time("src.cli", repeat=3)
+    assert result["forbidden_loaded"] == [], f"cli startup imported {result['forbidden_loaded']}"
+    assert result["median_ms"] <= result["budget_ms"], f"slowest imports: {result['slowest']}"
@@ -0,0 +1,13 @@
+import sqlite3
+
+from typer.testing import CliRunner
+
+from src.cli import app
+
+
+def test_init_db_creates_tables(db_path):
+    result = CliRunner().invoke(app, ["init-db"])
+    assert result.exit_code == 0, result.output
+    with sqlite3.connect(db_path) as conn:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {"locations", "readings", "alerts", "daily_rollups", "notification_outbox"} <= tables
@@ -0,0 +1,19 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from src import models  # noqa: F401  (registers the tables on Base)
+from src.db import Base, create_all, make_engine
+from src.query_plans import full_table_scans
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = make_engine(f"sqlite:///{tmp_path / 'aqi.db'}")
+    create_all(Base, engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def test_hot_queries_use_indexes(db):
+    assert full_table_scans(db) == {}